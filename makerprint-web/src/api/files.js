@@ -14,8 +14,11 @@ export const uploadFiles = async (files, folderPath = '') => {
     });
 };
 
-export const fetchFileTree = () => {
-    return axios.get(`${API_URL}/files/tree/`).then((res) => res.data);
+export const fetchFileTree = (path, depth) => {
+    const params = {};
+    if (path !== undefined) params.path = path;
+    if (depth !== undefined) params.depth = depth;
+    return axios.get(`${API_URL}/files/tree/`, { params }).then((res) => res.data);
 };
 
 export const fetchFilesFlat = () => {
@@ -60,10 +63,27 @@ export const removeFromQueue = (queueItemId) => {
     return axios.delete(`${API_URL}/queue/${queueItemId}`);
 };
 
+export const addManyToQueue = (items) => {
+    // items: [{ file_path, tags }]
+    return axios.post(`${API_URL}/queue/batch/`, { items });
+};
+
+export const removeManyFromQueue = (itemIds) => {
+    return axios.delete(`${API_URL}/queue/batch/`, { data: { item_ids: itemIds } });
+};
+
+export const updateManyQueueStatus = (itemIds, status, errorMessage = null) => {
+    return axios.patch(`${API_URL}/queue/batch/status/`, { item_ids: itemIds, status, error_message: errorMessage });
+};
+
 export const reorderQueue = (itemIds) => {
     return axios.put(`${API_URL}/queue/reorder/`, { item_ids: itemIds });
 };
 
+export const moveQueueItem = (queueItemId, { beforeId = null, afterId = null } = {}) => {
+    return axios.put(`${API_URL}/queue/${queueItemId}/move/`, { before_id: beforeId, after_id: afterId });
+};
+
 export const clearQueue = (tags = null) => {
     const params = tags ? { tags: tags.join(',') } : {};
     return axios.delete(`${API_URL}/queue/`, { params });
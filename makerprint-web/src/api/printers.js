@@ -12,6 +12,16 @@ export async function fetchPrinterStatus(printer_name) {
     return response;
 }
 
+// Server-Sent Events stream: every printer once, then only the ones that changed.
+// Returns a function closing the stream.
+export function subscribePrinterStatus(onStatus) {
+    const source = new EventSource(`${API_URL}/printers/stream`);
+    source.addEventListener('status', (event) => {
+        onStatus(JSON.parse(event.data));
+    });
+    return () => source.close();
+}
+
 export async function startPrinter(printer_name, queue_item_id) {
     const response = await axios.post(`${API_URL}/printers/${printer_name}/start/`, { queue_item_id });
     return response;
@@ -42,6 +52,18 @@ export async function disconnectPrinter(printer_name) {
     return response;
 }
 
+// names: list of printer names, every available (or connected) printer when omitted.
+// Resolves to { [name]: { success, error, status } }
+export async function connectAllPrinters(names = null) {
+    const response = await axios.post(`${API_URL}/printers/connect_all/`, { names });
+    return response;
+}
+
+export async function disconnectAllPrinters(names = null) {
+    const response = await axios.post(`${API_URL}/printers/disconnect_all/`, { names });
+    return response;
+}
+
 export async function sendCmd(printer_name, command) {
     if (!printer_name || !command) {
         throw new Error("Printer name and command are required");
@@ -4,7 +4,7 @@ import {
     fetchQueueTags,
     addToQueue,
     removeFromQueue,
-    reorderQueue,
+    moveQueueItem,
     clearQueue,
     markQueueItemFailed,
     markQueueItemSuccessful,
@@ -114,8 +114,12 @@ export function usePrintQueue() {
             [newQueue[currentIndex], newQueue[newIndex]] = [newQueue[newIndex], newQueue[currentIndex]];
             setFullQueue(newQueue);
             
-            const newIds = newQueue.map(item => item.id);
-            await reorderQueue(newIds);
+            // only the moved item gets a new position server side
+            const anchorId = currentIds[newIndex];
+            await moveQueueItem(
+                queueItemId,
+                direction === 'up' ? { beforeId: anchorId } : { afterId: anchorId }
+            );
             setError(null);
         } catch (err: any) {
             setFullQueue(originalQueue);
@@ -7,6 +7,7 @@ import {
     disconnectPrinter,
     sendCmd,
     fetchPrinterStatus,
+    subscribePrinterStatus,
 } from '@/api/printers';
 
 
@@ -39,11 +40,12 @@ export function usePrinterStatus(printerName?: string) {
     useEffect(() => {
         if (!printerName) return;
 
-        const interval = setInterval(() => {
-            refreshStatus();
-        }, 5000);
-
-        return () => clearInterval(interval);
+        // status changes are pushed by the server instead of polled
+        return subscribePrinterStatus((printerStatus) => {
+            if (printerStatus.name === printerName) {
+                setStatus(printerStatus);
+            }
+        });
     }, [printerName]);
 
     const stop = async () => {
@@ -1,5 +1,5 @@
 import { useEffect, useState } from 'react';
-import { fetchPrinters } from '@/api/printers';
+import { fetchPrinters, subscribePrinterStatus } from '@/api/printers';
 import { Printer } from '@/data/printers';
 
 export function usePrinters() {
@@ -41,6 +41,15 @@ export function usePrinters() {
 
     useEffect(() => {
         loadPrinters();
+
+        // keep the list up to date with the status changes pushed by the server
+        return subscribePrinterStatus((printerStatus) => {
+            setPrinters(prev => prev.map(printer =>
+                printer.name === printerStatus.name
+                    ? { ...printer, ...printerStatus, displayName: printerStatus.displayName || printer.displayName }
+                    : printer
+            ));
+        });
     }, []);
 
     return { printers, loading, error, refreshPrinters: loadPrinters};
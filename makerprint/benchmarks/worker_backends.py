@@ -0,0 +1,192 @@
+"""
+Compare the printer worker backends (process, thread, task) on the mock printers.
+
+    cd makerprint
+    python benchmarks/worker_backends.py                  # every backend, 1 10 50 printers
+    python benchmarks/worker_backends.py --printers 10 --backends task thread
+    python benchmarks/worker_backends.py --idle           # workers only, no printer connected
+
+Each backend runs in a fresh interpreter. For every fleet size it creates one
+MockPrinter pty per printer (like MOCK=true does), starts a worker for each and
+connects them at 115200 baud, then reports:
+  - start all: time to start every worker and connect every printer, all at once
+  - memory: PSS added to the api process and its children, per printer
+  - 1 cmd p50: round trip of a single G-code command (M105), printers asked one by one
+  - N cmds p50: all printers sent a command at the same time, until the last answer
+
+--idle skips the connect and sends status commands instead, for an install
+whose Printrun has no mock serial support. WORKER_START_METHOD and the other
+manager settings are read from the environment as usual.
+
+`python benchmarks/worker_backends.py --idle` on a 4 core VM, fork start
+method. The connected run needs the Printrun-lite fork from the Dockerfile,
+which wasn't available there: with PyPI's Printrun the connect fails on the
+missing printcore callbacks.
+
+               start all   memory/printer   1 cmd p50   N cmds p50
+  process  N=1        11 ms        6.2 MiB       0.87 ms       0.4 ms
+  process  N=10      122 ms        5.2 MiB       0.61 ms       5.6 ms
+  process  N=50      733 ms        5.5 MiB       0.52 ms      23.4 ms
+  thread   N=1         2 ms        0.2 MiB       1.19 ms       0.3 ms
+  thread   N=10       13 ms        0.1 MiB       0.23 ms       1.8 ms
+  thread   N=50       34 ms        0.0 MiB       0.27 ms      11.2 ms
+  task     N=1         2 ms        0.2 MiB       1.37 ms       0.7 ms
+  task     N=10       18 ms        0.0 MiB       0.41 ms       2.7 ms
+  task     N=50       25 ms        0.0 MiB       0.78 ms      30.6 ms
+
+Latency is about the same across backends, memory is what sets them apart.
+Process stays the default: it is the only backend whose workers can be killed
+and restarted when they hang. With WORKER_START_METHOD=spawn a process worker
+costs ~23 MiB.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+BACKENDS = ("process", "thread", "task")
+BAUD = 115200
+
+
+def _setup_environment(printers: int):
+    """Point makerprint at a throw-away data folder with printers mock printers configured"""
+    data_dir = tempfile.mkdtemp(prefix="makerprint-bench-")
+    os.environ.update({
+        "GCODEFOLDER": os.path.join(data_dir, "gcode"),
+        "DATABASE_PATH": os.path.join(data_dir, "makerprint.db"),
+        "PRINTER_CONFIG": os.path.join(data_dir, "printers.yaml"),
+        "LOGPATH": os.path.join(data_dir, "log.txt"),
+        "LOGLEVEL": os.environ.get("LOGLEVEL", "WARNING"),
+        "MOCK": "true",
+        "WORKER_POOL_SIZE": "0",
+    })
+    import yaml
+    with open(os.environ["PRINTER_CONFIG"], "w") as f:
+        yaml.safe_dump({
+            "version": "1.0",
+            "printers": {
+                f"MockPrinter_{i + 1}": {
+                    "usb_vid": "1234",
+                    "usb_pid": f"500{i}",
+                    "display_name": f"Mock Printer {i + 1}",
+                    "preferred_baud": BAUD,
+                }
+                for i in range(printers)
+            },
+            "global_settings": {"auto_detect_new_devices": False},
+        }, f)
+
+
+def _pss(pid: int) -> int:
+    """Proportional set size of a process in KiB"""
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                if line.startswith("Pss:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def _memory() -> int:
+    """PSS of this process and its children in KiB"""
+    me = str(os.getpid())
+    total = _pss(os.getpid())
+    for entry in os.listdir("/proc"):
+        if entry.isdigit():
+            try:
+                with open(f"/proc/{entry}/stat") as f:
+                    if f.read().split()[3] == me:
+                        total += _pss(int(entry))
+            except OSError:
+                pass
+    return total
+
+
+async def _measure(backend: str, printers: int, idle: bool):
+    from makerprint import printer_manager as manager_module
+    from makerprint.printer_worker import WorkerCommand
+
+    manager_module.WORKER_BACKEND = backend
+    manager = manager_module.printer_manager
+    names = [f"MockPrinter_{i + 1}" for i in range(printers)]
+    command = WorkerCommand(action="status") if idle else WorkerCommand(action="command", data={"command": "M105"})
+
+    async def start(name):
+        if idle:
+            return await manager._send_command(name, WorkerCommand(action="status"), timeout=60)
+        return await manager.connect_printer(name, BAUD)
+
+    base = _memory()
+    started = time.perf_counter()
+    responses = await asyncio.gather(*(start(name) for name in names))
+    start_all = time.perf_counter() - started
+    failed = [(name, response.error) for name, response in zip(names, responses) if not response or not response.success]
+    if failed:
+        print(f"{backend}: {len(failed)} printers failed to start, first: {failed[0]}", file=sys.stderr)
+        os._exit(1)
+    await asyncio.sleep(0.5)
+    memory = _memory() - base
+
+    single = []
+    for name in names[:10] * 3:
+        sent = time.perf_counter()
+        await manager._send_command(name, command)
+        single.append((time.perf_counter() - sent) * 1000)
+
+    fleet = []
+    for _ in range(20):
+        sent = time.perf_counter()
+        await asyncio.gather(*(manager._send_command(name, command) for name in names))
+        fleet.append((time.perf_counter() - sent) * 1000)
+
+    print(f"  {backend:8} N={printers:<3} {start_all * 1000:7.0f} ms  {memory / 1024 / printers:9.1f} MiB"
+          f"  {statistics.median(single):9.2f} ms  {statistics.median(fleet):8.1f} ms", flush=True)
+    await asyncio.gather(*(asyncio.to_thread(manager._stop_worker, name) for name in names))
+
+
+def _run_backend(backend: str, printers: list, idle: bool):
+    """Runs in its own interpreter, so backends don't share memory or workers"""
+    _setup_environment(max(printers))
+    from makerprint import utils
+    from makerprint.config import printer_config
+
+    for i in range(max(printers)):
+        utils.create_mock_printer(i)
+    printer_config.refresh_devices()
+
+    for count in printers:
+        asyncio.run(_measure(backend, count, idle))
+    os._exit(0)  # mock printer and manager threads are daemons, don't wait for atexit
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=list(BACKENDS))
+    parser.add_argument("--printers", nargs="+", type=int, default=[1, 10, 50])
+    parser.add_argument("--idle", action="store_true", help="don't connect the printers")
+    parser.add_argument("--backend", choices=BACKENDS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.backend:
+        _run_backend(args.backend, args.printers, args.idle)
+
+    print("               start all   memory/printer   1 cmd p50   N cmds p50")
+    for backend in args.backends:
+        process = subprocess.run(
+            [sys.executable, __file__, "--backend", backend, "--printers", *map(str, args.printers)]
+            + (["--idle"] if args.idle else [])
+        )
+        if process.returncode:
+            sys.exit(process.returncode)
+
+
+if __name__ == "__main__":
+    main()
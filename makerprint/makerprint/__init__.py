@@ -1 +0,0 @@
-from . import main
\ No newline at end of file
@@ -1,18 +1,83 @@
+import asyncio
 import os
+from contextlib import asynccontextmanager
+
 import fastapi
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi import HTTPException, File as FastAPIFile, UploadFile, Form, Body, Query
+from fastapi.responses import StreamingResponse
+from fastapi import HTTPException, Body, Query
 from typing import List, Optional
 
 from . import utils, models
 from .utils import logger
 from .printer_manager import printer_manager
 from .file_manager import file_manager, queue_manager
+from .uploads import UploadError, UploadParser
+
+QUEUE_MAINTENANCE_INTERVAL = 600  # seconds between two archive passes
+FILE_INDEX_POLL_INTERVAL = 5  # seconds between two checks for files changed outside the api
+
+
+async def queue_maintenance_loop():
+    """Periodically move completed queue items to the history"""
+    while True:
+        try:
+            await asyncio.to_thread(queue_manager.archive_completed_items)
+        except Exception as e:
+            logger.error(f"Error during queue maintenance: {e}")
+        await asyncio.sleep(QUEUE_MAINTENANCE_INTERVAL)
+
+
+async def file_index_loop():
+    """Build the file index at startup, then follow changes made outside the api"""
+    while True:
+        try:
+            await asyncio.to_thread(file_manager.refresh_index)
+        except Exception as e:
+            logger.error(f"Error while refreshing the file index: {e}")
+        await asyncio.sleep(FILE_INDEX_POLL_INTERVAL)
+
+
+def _etag_matches(request: fastapi.Request, etag: Optional[str]) -> bool:
+    """Whether If-None-Match names the version the client would get"""
+    header = request.headers.get("if-none-match")
+    if not header or etag is None:
+        return False
+    tags = [tag.strip() for tag in header.split(",")]
+    return "*" in tags or etag in (tag[2:] if tag.startswith("W/") else tag for tag in tags)
+
+
+def _not_modified(etag: str) -> fastapi.Response:
+    return fastapi.Response(status_code=304, headers={"ETag": etag})
+
+
+async def _index_json_with_etag(request: fastapi.Request, render) -> fastapi.Response:
+    """Answer 304 when the client already has this version of the file index, else
+    the rendered JSON body. A refresh can hold the index lock for a whole tree
+    walk: the ETag is read without it and building a body waits in a thread."""
+    etag = await asyncio.to_thread(file_manager.get_index_etag)  # builds the index on first use
+    if _etag_matches(request, etag):
+        return _not_modified(etag)
+    body = await asyncio.to_thread(render)
+    return fastapi.Response(content=body, media_type="application/json", headers={"ETag": etag})
+
+
+@asynccontextmanager
+async def lifespan(app: fastapi.FastAPI):
+    maintenance_task = asyncio.create_task(queue_maintenance_loop())
+    file_index_task = asyncio.create_task(file_index_loop())
+    # warm worker processes, so connecting a printer doesn't wait for one to start
+    asyncio.get_running_loop().run_in_executor(None, printer_manager.fill_worker_pool)
+    yield
+    maintenance_task.cancel()
+    file_index_task.cancel()
+
 
 app = fastapi.FastAPI(
     title="MakerPrint API",
     description="API for MakerPrint",
     version="0.1.0",
+    lifespan=lifespan,
 )
 
 app.add_middleware(
@@ -21,6 +86,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Total-Count", "X-Next-Cursor", "ETag"],
 )
 
 
@@ -38,9 +104,15 @@ async def index():
 
 
 @app.get("/printers/", response_model=dict[str, models.PrinterStatus])
-async def list_printers():
+async def list_printers(request: fastapi.Request, response: fastapi.Response):
+    printer_names = printer_manager.list_available_printers()
+    etag = printer_manager.get_status_etag(printer_names)
+    if _etag_matches(request, etag):
+        return _not_modified(etag)
+    response.headers["ETag"] = etag
+
     printers = {}
-    statuses = printer_manager.get_all_printer_statuses()
+    statuses = printer_manager.get_all_printer_statuses(printer_names)
     
     for name, status_dict in statuses.items():
         printers[name] = models.PrinterStatus(**status_dict)
@@ -48,6 +120,42 @@ async def list_printers():
     return printers
 
 
+STATUS_STREAM_KEEPALIVE = 15  # seconds, keeps proxies from closing idle streams
+
+
+def _status_event(status_dict: dict) -> str:
+    status = models.PrinterStatus(**status_dict)
+    return f"event: status\ndata: {status.model_dump_json()}\n\n"
+
+
+@app.get("/printers/stream")
+async def stream_printers(request: fastapi.Request):
+    """Server-Sent Events stream of printer statuses.
+    Sends every printer once, then only the printers whose status changed."""
+    async def events():
+        subscription = printer_manager.subscribe_status()
+        try:
+            for status_dict in printer_manager.get_all_printer_statuses().values():
+                yield _status_event(status_dict)
+
+            while not await request.is_disconnected():
+                try:
+                    changes = await asyncio.wait_for(subscription.get(), timeout=STATUS_STREAM_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                for status_dict in changes.values():
+                    yield _status_event(status_dict)
+        finally:
+            printer_manager.unsubscribe_status(subscription)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @app.get("/printers/{name}/", response_model=models.PrinterStatus)
 async def printer_status(name: str):
     status_dict = printer_manager.get_printer_status(name)
@@ -79,6 +187,35 @@ async def disconnect_printer(name: str):
     return models.PrinterStatus(**status_dict)
 
 
+def _fleet_results(responses: dict) -> dict[str, models.PrinterActionResult]:
+    return {
+        name: models.PrinterActionResult(
+            success=response.success,
+            error=response.error,
+            status=models.PrinterStatus(**(response.data if response.success and response.data and "status" in response.data
+                                           else printer_manager.get_printer_status(name))),
+        )
+        for name, response in responses.items()
+    }
+
+
+@app.post("/printers/connect_all/", response_model=dict[str, models.PrinterActionResult])
+async def connect_all_printers(
+    names: Optional[List[str]] = Body(None, embed=True),
+    baud: int = None,
+):
+    """Connect the given printers (every available one by default) in parallel"""
+    responses = await printer_manager.connect_all(names, baud)
+    return _fleet_results(responses)
+
+
+@app.post("/printers/disconnect_all/", response_model=dict[str, models.PrinterActionResult])
+async def disconnect_all_printers(names: Optional[List[str]] = Body(None, embed=True)):
+    """Disconnect the given printers (every connected one by default) in parallel"""
+    responses = await printer_manager.disconnect_all(names)
+    return _fleet_results(responses)
+
+
 @app.post("/printers/{name}/command/", response_model=models.PrinterStatus)
 async def printer_command(name: str, data: dict = Body(...)):
     command = data.get("command", "")
@@ -156,48 +293,59 @@ async def printer_clear_bed(name: str):
 
 
 @app.get("/files/tree/", response_model=models.FileNode)
-async def get_file_tree():
-    """Get the complete file tree structure"""
-    return file_manager.get_file_tree()
+async def get_file_tree(
+    request: fastapi.Request,
+    path: str = Query(None),
+    depth: int = Query(None, ge=0),
+):
+    """Get the file tree structure. `path` limits it to a subfolder and `depth`
+    to that many levels below it, deeper folders come back with null children."""
+    if path is None and depth is None:
+        return await _index_json_with_etag(request, file_manager.get_file_tree_json)
+
+    etag = await asyncio.to_thread(file_manager.get_index_etag)
+    if _etag_matches(request, etag):
+        return _not_modified(etag)
+    body = await asyncio.to_thread(file_manager.get_subtree_json, path or "", depth)
+    if body is None:
+        raise HTTPException(status_code=404, detail="Path not found")
+    return fastapi.Response(content=body, media_type="application/json", headers={"ETag": etag})
 
 
 @app.get("/files/list/", response_model=List[models.File])
-async def get_files_flat():
+async def get_files_flat(request: fastapi.Request):
     """Get a flat list of all .gcode files"""
-    return file_manager.get_files_flat()
+    return await _index_json_with_etag(request, file_manager.get_files_flat_json)
+
+
+@app.post("/files/upload/", openapi_extra={"requestBody": {"content": {"multipart/form-data": {"schema": {
+    "type": "object",
+    "required": ["files"],
+    "properties": {
+        "files": {"type": "array", "items": {"type": "string", "format": "binary"}},
+        "folder_path": {"type": "string", "default": ""},
+    },
+}}}}})
+async def upload_files(request: fastapi.Request):
+    """Upload one or more files to the specified folder.
+    The body is parsed as it arrives and each file goes straight to the blob
+    store, the request is refused as soon as a file isn't a .gcode file or
+    crosses MAX_UPLOAD_SIZE."""
+    try:
+        upload = UploadParser(file_manager, request.headers.get("content-type", ""))
+        await upload.parse(request.stream())
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    folder_path = upload.field("folder_path")
 
-
-@app.post("/files/upload/")
-async def upload_files(
-    files: List[UploadFile] = FastAPIFile(...),
-    folder_path: str = Form("")
-):
-    """Upload one or more files to the specified folder"""
     results = []
-    
-    for file in files:
-        if not file.filename.endswith(".gcode"):
-            results.append({
-                "filename": file.filename,
-                "success": False,
-                "error": "File must be a .gcode file"
-            })
-            continue
-        
-        try:
-            content = await file.read()
-            success = file_manager.save_uploaded_file(content, file.filename, folder_path)
-            results.append({
-                "filename": file.filename,
-                "success": success,
-                "error": None if success else "Failed to save file"
-            })
-        except Exception as e:
-            results.append({
-                "filename": file.filename,
-                "success": False,
-                "error": str(e)
-            })
+    for part in upload.files():
+        success = await asyncio.to_thread(file_manager.save_blob, part.digest, part.filename, folder_path)
+        results.append({
+            "filename": part.filename,
+            "success": success,
+            "error": None if success else "Failed to save file"
+        })
     
     return {"results": results}
 
@@ -205,7 +353,7 @@ async def upload_files(
 @app.post("/files/folder/")
 async def create_folder(folder_path: str = Body(..., embed=True)):
     """Create a new folder"""
-    success = file_manager.create_folder(folder_path)
+    success = await asyncio.to_thread(file_manager.create_folder, folder_path)
     if not success:
         raise HTTPException(status_code=400, detail="Failed to create folder")
     return {"success": True}
@@ -214,7 +362,7 @@ async def create_folder(folder_path: str = Body(..., embed=True)):
 @app.delete("/files/{file_path:path}")
 async def delete_file_or_folder(file_path: str):
     """Delete a file or folder"""
-    success = file_manager.delete_item(file_path)
+    success = await asyncio.to_thread(file_manager.delete_item, file_path)
     if not success:
         raise HTTPException(status_code=404, detail="File or folder not found")
     return {"success": True}
@@ -223,7 +371,7 @@ async def delete_file_or_folder(file_path: str):
 @app.put("/files/{file_path:path}/rename/")
 async def rename_file_or_folder(file_path: str, new_name: str = Body(..., embed=True)):
     """Rename a file or folder"""
-    success = file_manager.rename_item(file_path, new_name)
+    success = await asyncio.to_thread(file_manager.rename_item, file_path, new_name)
     if not success:
         raise HTTPException(status_code=404, detail="File or folder not found")
     return {"success": True}
@@ -232,7 +380,7 @@ async def rename_file_or_folder(file_path: str, new_name: str = Body(..., embed=
 @app.put("/files/{file_path:path}/move/")
 async def move_file_or_folder(file_path: str, new_folder_path: str = Body(..., embed=True)):
     """Move a file or folder to a new location"""
-    success = file_manager.move_item(file_path, new_folder_path)
+    success = await asyncio.to_thread(file_manager.move_item, file_path, new_folder_path)
     if not success:
         raise HTTPException(status_code=400, detail="Failed to move file or folder")
     return {"success": True}
@@ -241,16 +389,60 @@ async def move_file_or_folder(file_path: str, new_folder_path: str = Body(..., e
 # queue endpoints
 
 @app.get("/queue/", response_model=List[models.QueueItem])
-async def get_queue(tags: str = Query(None)):
-    """Get the print queue, optionally filtered by tags"""
+async def get_queue(
+    request: fastapi.Request,
+    response: fastapi.Response,
+    tags: str = Query(None),
+    status: str = Query(None),
+    printer_name: str = Query(None),
+    after: str = Query(None),
+    limit: int = Query(None, ge=1, le=1000),
+):
+    """Get the print queue, optionally filtered by tags, status and printer.
+    Pages are requested with `limit` and the `after` cursor taken from the
+    X-Next-Cursor header of the previous page, the number of matching items is
+    in X-Total-Count."""
+    etag = queue_manager.get_etag()
+    if _etag_matches(request, etag):
+        return _not_modified(etag)
+    if etag:
+        response.headers["ETag"] = etag
+
     tag_filter = tags.split(',') if tags else None
-    return queue_manager.get_queue(tag_filter)
+    statuses = status.split(',') if status else None
+    try:
+        items, total, next_cursor = queue_manager.get_queue_page(
+            tag_filter, statuses=statuses, printer_name=printer_name, after=after, limit=limit
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    response.headers["X-Total-Count"] = str(total)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return items
 
 @app.get("/queue/tags/", response_model=List[str])
-async def get_all_queue_tags():
+async def get_all_queue_tags(request: fastapi.Request, response: fastapi.Response):
     """Get all available tags in the queue"""
+    etag = queue_manager.get_etag()
+    if _etag_matches(request, etag):
+        return _not_modified(etag)
+    if etag:
+        response.headers["ETag"] = etag
     return queue_manager.get_all_tags()
 
+def _queue_tags(file_path: str, tags: List[str]) -> List[str]:
+    """Cleanup tags and add the last folder as a tag"""
+    # probably will be a bit different in the future ?
+    # with the choice of tags for users and so on ?
+    folder = os.path.dirname(file_path)
+    tags = [tag.strip() for tag in tags if tag.strip()]
+    if folder and folder not in tags:
+        tags.append(folder)
+    return tags
+
+
 @app.post("/queue/")
 async def add_to_queue(
     file_path: str = Body(..., embed=True),
@@ -261,22 +453,59 @@ async def add_to_queue(
         raise HTTPException(status_code=404, detail="File not found")
     
     file_name = os.path.basename(file_path)
-    folder = os.path.dirname(file_path)
-
-    # cleanup tags and add the last folder as a tag
-    # probably will be a bit different in the future ?
-    # with the choice of tags for users and so on ?
-    tags = [tag.strip() for tag in tags if tag.strip()]
-    if folder and folder not in tags:
-        tags.append(folder)
-
-    queue_item_id = queue_manager.add_to_queue(file_path, file_name, tags)
+    queue_item_id = queue_manager.add_to_queue(
+        file_path, file_name, _queue_tags(file_path, tags), file_hash=file_manager.get_file_hash(file_path)
+    )
     
     return {
         "success": True,
         "queue_item_id": queue_item_id
     }
 
+@app.post("/queue/batch/")
+@app.post("/queue/batch", include_in_schema=False)
+async def add_many_to_queue(items: List[models.QueueBatchEntry] = Body(..., embed=True)):
+    """Add several files to the queue at once, nothing is added if one is missing"""
+    missing = [entry.file_path for entry in items if not file_manager.file_exists(entry.file_path)]
+    if missing:
+        raise HTTPException(status_code=404, detail={"message": "Files not found", "files": missing})
+
+    queue_item_ids = queue_manager.add_many_to_queue([
+        (entry.file_path, os.path.basename(entry.file_path), _queue_tags(entry.file_path, entry.tags),
+         file_manager.get_file_hash(entry.file_path))
+        for entry in items
+    ])
+    if items and not queue_item_ids:
+        raise HTTPException(status_code=500, detail="Failed to add files to queue")
+    return {
+        "success": True,
+        "queue_item_ids": queue_item_ids
+    }
+
+# registered without the slash too, DELETE /queue/batch would otherwise reach /queue/{queue_item_id}
+@app.delete("/queue/batch/")
+@app.delete("/queue/batch", include_in_schema=False)
+async def remove_many_from_queue(item_ids: List[str] = Body(..., embed=True)):
+    """Remove several items from the queue at once, unknown ids are ignored"""
+    removed = queue_manager.remove_many_from_queue(item_ids)
+    return {"success": True, "removed": removed}
+
+@app.patch("/queue/batch/status/")
+@app.patch("/queue/batch/status", include_in_schema=False)
+async def update_many_queue_status(
+    item_ids: List[str] = Body(..., embed=True),
+    status: str = Body(..., embed=True),
+    error_message: Optional[str] = Body(None, embed=True)
+):
+    """Set the status of several items at once: todo (retry), success, finished or failed"""
+    if status not in ("todo", "success", "finished", "failed"):
+        raise HTTPException(status_code=400, detail=f"Invalid status {status}")
+    if status == "failed" and error_message is None:
+        error_message = "Print failed"
+
+    updated = queue_manager.update_many_status(item_ids, status, error_message=error_message)
+    return {"success": True, "updated": updated}
+
 @app.delete("/queue/{queue_item_id}")
 async def remove_from_queue(queue_item_id: str):
     """Remove an item from the queue"""
@@ -295,6 +524,21 @@ async def reorder_queue(
         raise HTTPException(status_code=400, detail="Failed to reorder queue")
     return {"success": True}
 
+@app.put("/queue/{queue_item_id}/move/")
+async def move_queue_item(
+    queue_item_id: str,
+    before_id: Optional[str] = Body(None, embed=True),
+    after_id: Optional[str] = Body(None, embed=True)
+):
+    """Move a queue item right before or after another one"""
+    if (before_id is None) == (after_id is None):
+        raise HTTPException(status_code=400, detail="Exactly one of before_id or after_id is required")
+
+    success = queue_manager.move_queue_item(queue_item_id, before_id=before_id, after_id=after_id)
+    if not success:
+        raise HTTPException(status_code=404, detail="Queue item not found")
+    return {"success": True}
+
 @app.delete("/queue/")
 async def clear_queue(tags: str = Query(None)):
     """Clear the queue, optionally filtered by tags"""
@@ -334,6 +578,19 @@ async def mark_queue_item_successful(queue_item_id: str):
     return {"success": True}
 
 
+@app.get("/queue/history/", response_model=List[models.HistoryItem])
+async def get_queue_history(
+    status: str = Query(None),
+    printer_name: str = Query(None),
+    before: int = Query(None),
+    limit: int = Query(100, ge=1, le=1000),
+):
+    """Get completed items moved out of the queue, most recent first.
+    The next page is requested with `before` set to the last history_id."""
+    statuses = status.split(',') if status else None
+    return queue_manager.get_history(statuses=statuses, printer_name=printer_name, before=before, limit=limit)
+
+
 @app.get("/queue/{queue_item_id}/", response_model=models.QueueItem)
 async def get_queue_item(queue_item_id: str):
     """Get details of a specific queue item"""
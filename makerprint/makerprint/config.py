@@ -4,13 +4,112 @@ Configuration management for printer mappings and properties
 import json
 import yaml
 import os
-from typing import Dict, Optional
+import threading
+import time
+from typing import Dict, List, Optional
 import serial
 import serial.tools.list_ports
 import re
 
 from . import utils
 
+PORT_CACHE_TTL = float(os.environ.get("PORT_CACHE_TTL", 2.0))  # seconds a serial port listing is reused before sysfs is walked again
+MOCK_VID = "1234"  # usb_vid of the mock printers, matched by description instead of USB ids
+
+
+class DeviceRegistry:
+    """Cached listing of the serial ports, indexed by USB ids and location.
+
+    comports() walks sysfs on every call, so its result is reused for
+    PORT_CACHE_TTL seconds and the indexes used to match printer configs are
+    only rebuilt when the set of ports actually changed."""
+
+    def __init__(self, ttl: float = PORT_CACHE_TTL):
+        self.ttl = ttl
+        self.devices = {}      # device path -> port info, in enumeration order
+        self.signatures = {}   # device path -> "vid:pid:location"
+        self.generation = 0    # bumped every time the set of ports changes
+        self._order = {}       # device path -> enumeration rank, to break ties like a linear scan
+        self._vid_pid = {}     # device path -> "vid:pid"
+        self._by_vid_pid: Dict[str, List[str]] = {}
+        self._by_location: Dict[str, List[str]] = {}
+        self._mock_by_pid: Dict[str, List[str]] = {}
+        self._descriptions = {}  # device path -> description, mock ports are only told apart by it
+        self._scanned_at = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def signature(device) -> str:
+        """Get device signature, same format as the config signatures"""
+        vid = getattr(device, 'vid', None)
+        pid = getattr(device, 'pid', None)
+        location = getattr(device, 'location', '')
+        vid_str = f"{vid:04x}" if vid is not None else ""
+        pid_str = f"{pid:04x}" if pid is not None else ""
+        return f"{vid_str}:{pid_str}:{location}"
+
+    def refresh(self, force: bool = False) -> int:
+        """Rescan the ports if the cached listing expired, return the generation"""
+        with self._lock:
+            now = time.monotonic()
+            if not force and self._scanned_at is not None and now - self._scanned_at < self.ttl:
+                return self.generation
+
+            devices = {device.device: device for device in serial.tools.list_ports.comports()}
+            self._scanned_at = now
+            signatures = {path: self.signature(device) for path, device in devices.items()}
+            descriptions = {path: getattr(device, 'description', None) for path, device in devices.items()}
+            if signatures == self.signatures and descriptions == self._descriptions:
+                return self.generation
+
+            self._index(devices, signatures)
+            self._descriptions = descriptions
+            self.generation += 1
+            return self.generation
+
+    def invalidate(self):
+        """Forget the cached listing, the next lookup rescans the ports"""
+        with self._lock:
+            self._scanned_at = None
+
+    def _index(self, devices: Dict, signatures: Dict[str, str]):
+        order, vid_pid, by_vid_pid, by_location, mock_by_pid = {}, {}, {}, {}, {}
+        for rank, (path, device) in enumerate(devices.items()):
+            order[path] = rank
+            vid, pid, location = signatures[path].split(":", 2)
+            if vid and pid:
+                vid_pid[path] = f"{vid}:{pid}"
+                by_vid_pid.setdefault(vid_pid[path], []).append(path)
+            if getattr(device, 'location', None) is not None:
+                by_location.setdefault(device.location, []).append(path)
+
+            description = getattr(device, 'description', None) or ""
+            if 'Mock' in description and description.split()[-1].isdigit():
+                mock_by_pid.setdefault(f"500{description.split()[-1]}", []).append(path)
+
+        self.devices, self.signatures, self._order = devices, signatures, order
+        self._vid_pid, self._by_vid_pid, self._by_location, self._mock_by_pid = vid_pid, by_vid_pid, by_location, mock_by_pid
+
+    def find(self, usb_vid: Optional[str], usb_pid: Optional[str], usb_location: Optional[str], mock_mode: bool = False) -> Optional[str]:
+        """Device path of the first port matching a printer config.
+
+        Matches by location (and VID/PID when both are set), by VID/PID when no
+        location is configured, or by the mock pattern in mock mode."""
+        with self._lock:
+            wanted = f"{usb_vid}:{usb_pid}".lower() if usb_vid and usb_pid else None
+            candidates = []
+            if mock_mode and usb_vid == MOCK_VID and usb_pid and usb_pid.startswith('500'):
+                candidates += self._mock_by_pid.get(usb_pid, [])[:1]
+            if usb_location:
+                paths = self._by_location.get(usb_location, [])
+                if wanted:
+                    paths = [path for path in paths if self._vid_pid.get(path) == wanted]
+                candidates += paths[:1]
+            elif wanted:
+                candidates += self._by_vid_pid.get(wanted, [])[:1]
+
+            return min(candidates, key=self._order.get) if candidates else None
+
 
 class PrinterConfig:
     """Manages printer configuration and device mapping"""
@@ -20,7 +119,12 @@ class PrinterConfig:
         self.config_data = {}
         self.device_mapping = {}  # maps device paths to printer configs
         self.name_mapping = {}    # maps printer names to printer configs
+        self.available = {}       # maps available printer names to device paths
+        self.devices = DeviceRegistry()
         self.logger = utils.logger.getChild("config")
+        self._config_revision = 0  # bumped when the configured printers change
+        self._mapped = None        # (ports generation, config revision) the mappings were built for
+        self._lock = threading.RLock()
         
         self.load_config()
         self._update_device_mapping()
@@ -39,6 +143,7 @@ class PrinterConfig:
                 else:
                     self.config_data = json.load(f)
             
+            self._config_revision += 1
             self.logger.info(f"Loaded printer configuration from {self.config_path}")
             
             # Validate config structure
@@ -51,6 +156,7 @@ class PrinterConfig:
     
     def save_config(self):
         """Save current configuration to file"""
+        self._config_revision += 1
         try:
             # Ensure directory exists
             os.makedirs(os.path.dirname(self.config_path), exist_ok=True)
@@ -86,11 +192,11 @@ class PrinterConfig:
         """Create a default configuration file based on detected devices"""
         self.logger.info("Creating default printer configuration...")
         
-        devices = serial.tools.list_ports.comports()
+        self.devices.refresh(force=True)
         printers = {}
         
         # create entries for detected USB devices that might be printers
-        for i, device in enumerate(devices):
+        for i, device in enumerate(self.devices.devices.values()):
             printer_name = f"Printer_{i+1}"
             device_info = self._extract_device_info(device)
             
@@ -105,7 +211,7 @@ class PrinterConfig:
             for i in range(3):
                 printer_name = f"MockPrinter_{i+1}"
                 printers[printer_name] = {
-                    "usb_vid": "1234",
+                    "usb_vid": MOCK_VID,
                     "usb_pid": f"500{i}",
                     "display_name": f"Mock Printer {i+1}",
                     "preferred_baud": 115200
@@ -125,93 +231,45 @@ class PrinterConfig:
         self.save_config()
     
     def _update_device_mapping(self):
-        """Update internal device mappings"""
-        self.device_mapping.clear()
-        self.name_mapping.clear()
-        
-        if 'printers' not in self.config_data:
-            return
-        
-        # Get current devices to map USB IDs to device paths
-        current_devices = {device.device: device for device in serial.tools.list_ports.comports()}
-        
-        for printer_name, printer_config in self.config_data['printers'].items():
-            # Find the actual device path by matching USB VID/PID or serial number
-            device_path = self._find_device_path(printer_config, current_devices)
-            if device_path:
-                self.device_mapping[device_path] = {
-                    'name': printer_name,
-                    'config': printer_config
-                }
+        """Update internal device mappings, only when the ports or the config changed"""
+        with self._lock:
+            generation = self.devices.refresh()
+            if self._mapped == (generation, self._config_revision):
+                return False
+
+            self.device_mapping.clear()
+            self.name_mapping.clear()
+            self.available.clear()
             
-            self.name_mapping[printer_name] = printer_config
+            for printer_name, printer_config in self.config_data.get('printers', {}).items():
+                # Find the actual device path by matching USB VID/PID or location
+                device_path = self._find_device_path(printer_config)
+                if device_path:
+                    self.device_mapping[device_path] = {
+                        'name': printer_name,
+                        'config': printer_config
+                    }
+                    self.available[printer_name] = device_path
+                
+                self.name_mapping[printer_name] = printer_config
+
+            self._mapped = (generation, self._config_revision)
+            return True
     
-    def _find_device_path(self, printer_config: Dict, current_devices: Dict) -> Optional[str]:
+    def _find_device_path(self, printer_config: Dict) -> Optional[str]:
         """Find the current device path for a printer configuration"""
-        usb_vid = printer_config.get('usb_vid')
-        usb_pid = printer_config.get('usb_pid')
-        usb_location = printer_config.get('usb_location')
-        
         mock_mode = os.environ.get("MOCK", "false").lower() == "true"
-        
-        for device_path, device in current_devices.items():
-            if mock_mode and self._is_mock_device_match(device, usb_vid, usb_pid):
-                return device_path
-            elif self._is_location_match(device, usb_location, usb_vid, usb_pid):
-                return device_path
-            elif self._is_vid_pid_match(device, usb_vid, usb_pid, usb_location):
-                return device_path
-        
-        return None
-    
-    def _is_mock_device_match(self, device, usb_vid: str, usb_pid: str) -> bool:
-        """Check if device matches mock printer pattern"""
-        if not (hasattr(device, 'description') and 'Mock' in device.description):
-            return False
-        
-        if usb_vid != "1234" or not usb_pid or not usb_pid.startswith('500'):
-            return False
-        
-        device_index = device.description.split()[-1]
-        if not device_index.isdigit():
-            return False
-        
-        expected_pid = f"500{device_index}"
-        return usb_pid == expected_pid
-    
-    def _is_location_match(self, device, usb_location: str, usb_vid: str, usb_pid: str) -> bool:
-        """Check if device matches by USB location"""
-        if not usb_location or not hasattr(device, 'location'):
-            return False
-        
-        if device.location != usb_location:
-            return False
-        
-        if usb_vid and usb_pid:
-            return self._verify_vid_pid(device, usb_vid, usb_pid)
-        
-        return True
-    
-    def _is_vid_pid_match(self, device, usb_vid: str, usb_pid: str, usb_location: str) -> bool:
-        """Check if device matches by VID/PID (when no location specified)"""
-        if not usb_vid or not usb_pid or usb_location:
-            return False
-        
-        return self._verify_vid_pid(device, usb_vid, usb_pid)
-    
-    def _verify_vid_pid(self, device, expected_vid: str, expected_pid: str) -> bool:
-        """Verify device VID/PID matches expected values"""
-        device_vid = getattr(device, 'vid', None)
-        device_pid = getattr(device, 'pid', None)
-        
-        if device_vid is None or device_pid is None:
-            return False
-        
-        device_vid_str = f"{device_vid:04x}" if isinstance(device_vid, int) else str(device_vid)
-        device_pid_str = f"{device_pid:04x}" if isinstance(device_pid, int) else str(device_pid)
-        
-        return (device_vid_str.lower() == expected_vid.lower() and
-                device_pid_str.lower() == expected_pid.lower())
+        return self.devices.find(
+            printer_config.get('usb_vid'),
+            printer_config.get('usb_pid'),
+            printer_config.get('usb_location'),
+            mock_mode,
+        )
+
+    def refresh_devices(self):
+        """Rescan the serial ports now instead of waiting for the cache to expire"""
+        self.devices.invalidate()
+        self._update_device_mapping()
     
     def get_printer_by_device(self, device_path: str) -> Optional[Dict]:
         """Get printer configuration by device path"""
@@ -227,21 +285,13 @@ class PrinterConfig:
     
     def get_available_printers(self) -> Dict[str, str]:
         """Get available printers (name -> device_path mapping)"""
-        self._update_device_mapping()
-        
-        available = {}
-        current_devices = {device.device: device for device in serial.tools.list_ports.comports()}
-        
-        for printer_name, config in self.get_all_configured_printers().items():
-            device_path = self._find_device_path(config, current_devices)
-            if device_path:
-                available[printer_name] = device_path
-        
-        # Auto-detect new devices if enabled
-        if self.config_data.get('global_settings', {}).get('auto_detect_new_devices', True):
-            self._auto_detect_new_devices(current_devices, available)
-        
-        return available
+        with self._lock:
+            # Auto-detect new devices if enabled, only needed when something changed
+            if (self._update_device_mapping()
+                    and self.config_data.get('global_settings', {}).get('auto_detect_new_devices', True)):
+                self._auto_detect_new_devices(self.devices.devices, self.available)
+            
+            return dict(self.available)
     
     def _auto_detect_new_devices(self, current_devices: Dict, available: Dict):
         """Auto-detect and add new devices"""
@@ -254,6 +304,9 @@ class PrinterConfig:
                 continue
             
             device_signature = self._get_device_signature(device)
+            if device_signature == "::":
+                # no USB ids nor location (e.g. a builtin ttyS port), it could never be matched again
+                continue
             if device_signature not in configured_devices:
                 printer_name = self._add_auto_detected_printer(device, device_path)
                 available[printer_name] = device_path
@@ -274,12 +327,7 @@ class PrinterConfig:
     
     def _get_device_signature(self, device) -> str:
         """Get device signature for comparison"""
-        vid = getattr(device, 'vid', None)
-        pid = getattr(device, 'pid', None)
-        location = getattr(device, 'location', '')
-        vid_str = f"{vid:04x}" if vid is not None else ""
-        pid_str = f"{pid:04x}" if pid is not None else ""
-        return f"{vid_str}:{pid_str}:{location}"
+        return DeviceRegistry.signature(device)
     
     def _get_config_signature(self, config: Dict) -> str:
         """Get config signature for comparison"""
@@ -326,21 +374,49 @@ class PrinterConfig:
             return config.get('preferred_baud')
         return None
     
+    def get_printer_worker_backend(self, printer_name: str) -> Optional[str]:
+        """Get the worker backend set for a printer (process, thread or task), if any"""
+        config = self.get_printer_by_name(printer_name)
+        if config:
+            return config.get('worker_backend')
+        return None
+
+    def set_printer_preferred_baud(self, printer_name: str, baud: int) -> bool:
+        """Remember the baudrate a printer answered at, so the next connect skips detection"""
+        with self._lock:
+            config = self.get_printer_by_name(printer_name)
+            if not config or config.get('preferred_baud') == baud:
+                return False
+
+            config['preferred_baud'] = baud
+            self.logger.info(f"Saving baudrate {baud} for {printer_name}")
+            self.save_config()
+            return True
+
+    def get_baud_candidates(self, printer_name: str) -> List[int]:
+        """Baudrates to try for a printer, most likely first: its own preferred
+        baudrate, the ones saved for printers with the same USB ids, then the
+        configured defaults and the remaining standard rates"""
+        config = self.get_printer_by_name(printer_name) or {}
+        candidates = [config.get('preferred_baud')]
+
+        usb_ids = (config.get('usb_vid'), config.get('usb_pid'))
+        if all(usb_ids):
+            seen = {}
+            for other in self.get_all_configured_printers().values():
+                if (other.get('usb_vid'), other.get('usb_pid')) == usb_ids and other.get('preferred_baud'):
+                    seen[other['preferred_baud']] = seen.get(other['preferred_baud'], 0) + 1
+            candidates += sorted(seen, key=seen.get, reverse=True)
+
+        candidates += self.config_data.get('global_settings', {}).get('default_baud_rates', [])
+        candidates += utils.BAUDRATES
+        return list(dict.fromkeys(baud for baud in candidates if baud))
+
     def is_printer_available(self, printer_name: str) -> tuple[bool, Optional[str]]:
         """Check if a specific printer is available and return its device path"""
-        # First check if it's a configured printer
-        printer_config_data = self.get_printer_by_name(printer_name)
-        if printer_config_data:
-            current_devices = {device.device: device for device in serial.tools.list_ports.comports()}
-            device_path = self._find_device_path(printer_config_data, current_devices)
-            return device_path is not None, device_path
-        
-        # if not config, check if it's an auto-detected printer
-        available_printers = self.get_available_printers()
-        if printer_name in available_printers:
-            return True, available_printers[printer_name]
-        
-        return False, None
+        # configured and auto-detected printers both end up in the available mapping
+        device_path = self.get_available_printers().get(printer_name)
+        return device_path is not None, device_path
 
 
 # Global config instance
@@ -2,12 +2,16 @@
 Persistence layer for queue management
 """
 import json
+import os
 import sqlite3
+import threading
+from array import array
 from pathlib import Path
-from typing import List
+from typing import List, Optional, Tuple
 from datetime import datetime
 
 from . import models, utils
+from .gcode import GCodeAnalysis
 from .utils import logger
 
 
@@ -44,17 +48,55 @@ class JSONQueuePersistence:
             return []
 
 
+# column order shared by every query reading or writing a full queue item
+QUEUE_COLUMNS = (
+    "id, file_path, file_name, added_at, tags, "
+    "status, printer_name, started_at, finished_at, error_message, file_hash"
+)
+
+# seconds a connection waits on a locked database before giving up
+BUSY_TIMEOUT = 10.0
+
+# spacing between consecutive order_index values, leaves room to move an item
+# between two neighbours with a single UPDATE before a rebalance is needed
+ORDER_GAP = 1 << 16
+
+
 class SQLiteDatabase:
     """SQLite database for queue persistence"""
     
     def __init__(self, db_path: str = "makerprint.db"):
         self.db_path = Path(db_path)
         self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
         self._init_database()
+
+    def _connect(self) -> sqlite3.Connection:
+        """Get the long-lived connection of the current thread.
+        Connections are never shared: a forked worker process inherits the
+        thread-local of its parent, so the owning pid is checked as well."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=BUSY_TIMEOUT, cached_statements=256)
+            # WAL lets the API and the printer workers read while one of them writes,
+            # NORMAL is durable enough in WAL mode and avoids an fsync per commit
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(f"PRAGMA busy_timeout={int(BUSY_TIMEOUT * 1000)}")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def close(self):
+        """Close the connection of the current thread, if any"""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and self._local.pid == os.getpid():
+            conn.close()
+        self._local.conn = None
     
     def _init_database(self):
         """Initialize database schema"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect() as conn:
             # First, create the table with basic schema if it doesn't exist
             conn.execute("""
                 CREATE TABLE IF NOT EXISTS print_queue (
@@ -83,34 +125,164 @@ class SQLiteDatabase:
                 conn.execute("ALTER TABLE print_queue ADD COLUMN finished_at TEXT")
             if 'error_message' not in columns:
                 conn.execute("ALTER TABLE print_queue ADD COLUMN error_message TEXT")
+            if 'file_hash' not in columns:
+                conn.execute("ALTER TABLE print_queue ADD COLUMN file_hash TEXT")
                 
             # Create indexes after ensuring columns exist
             conn.execute("CREATE INDEX IF NOT EXISTS idx_queue_order ON print_queue(order_index)")
             conn.execute("CREATE INDEX IF NOT EXISTS idx_queue_status ON print_queue(status)")
             conn.execute("CREATE INDEX IF NOT EXISTS idx_queue_printer ON print_queue(printer_name)")
+
+            # Normalized tags, kept in sync with the JSON column so tag filters are indexed
+            tags_table_exists = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'queue_tags'"
+            ).fetchone() is not None
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS queue_tags (
+                    item_id TEXT NOT NULL,
+                    tag TEXT NOT NULL,
+                    PRIMARY KEY (item_id, tag)
+                ) WITHOUT ROWID;
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_queue_tags_tag ON queue_tags(tag, item_id)")
+            if not tags_table_exists:
+                # migrate databases created before the tags table existed
+                rows = conn.execute("SELECT id, tags FROM print_queue").fetchall()
+                conn.executemany(
+                    "INSERT OR IGNORE INTO queue_tags (item_id, tag) VALUES (?, ?)",
+                    [(item_id, tag) for item_id, tags in rows for tag in json.loads(tags)]
+                )
+
+            # Revision counters, bumped once by every committed write so other
+            # processes can tell whether their in-memory copy is stale
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS revisions (
+                    name TEXT PRIMARY KEY,
+                    revision INTEGER NOT NULL DEFAULT 0
+                );
+            """)
+            conn.execute("INSERT OR IGNORE INTO revisions (name, revision) VALUES ('print_queue', 0)")
+
+            # Append-only archive of completed items, keeps print_queue small
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS print_history (
+                    history_id INTEGER PRIMARY KEY,
+                    id TEXT NOT NULL,
+                    file_path TEXT NOT NULL,
+                    file_name TEXT NOT NULL,
+                    added_at TEXT NOT NULL,
+                    tags TEXT NOT NULL,  -- JSON array
+                    status TEXT NOT NULL,
+                    printer_name TEXT,
+                    started_at TEXT,
+                    finished_at TEXT,
+                    error_message TEXT,
+                    archived_at TEXT NOT NULL,
+                    file_hash TEXT
+                );
+            """)
+            history_columns = [row[1] for row in conn.execute("PRAGMA table_info(print_history)")]
+            if 'file_hash' not in history_columns:
+                conn.execute("ALTER TABLE print_history ADD COLUMN file_hash TEXT")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_history_finished ON print_history(finished_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_history_printer ON print_history(printer_name)")
+
+            # Cached G-code analysis, only valid while mtime and size still match the file
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS gcode_analysis (
+                    file_path TEXT PRIMARY KEY,
+                    mtime REAL NOT NULL,
+                    size INTEGER NOT NULL,
+                    line_count INTEGER NOT NULL,
+                    estimated_time REAL NOT NULL,
+                    filament_used REAL NOT NULL,
+                    layers BLOB NOT NULL,  -- array('Q') of line indexes
+                    time_table BLOB NOT NULL  -- array('d') of cumulative seconds
+                );
+            """)
+
+            # Content hash of every file stored through the blob store
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS file_hashes (
+                    path TEXT PRIMARY KEY,
+                    hash TEXT NOT NULL
+                );
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_file_hashes_hash ON file_hashes(hash)")
                 
             conn.commit()
+
+    @staticmethod
+    def _bump_queue_revision(conn):
+        """Increment the queue revision, must be called inside the writing transaction"""
+        conn.execute("UPDATE revisions SET revision = revision + 1 WHERE name = 'print_queue'")
+
+    def get_queue_revision(self) -> int:
+        """Get the current queue revision, -1 if it can't be read"""
+        try:
+            with self._connect() as conn:
+                row = conn.execute("SELECT revision FROM revisions WHERE name = 'print_queue'").fetchone()
+                return row[0] if row else -1
+        except Exception as e:
+            logger.error(f"Failed to read queue revision: {e}")
+            return -1
+
+    @staticmethod
+    def _write_item_tags(conn, items: List[models.QueueItem]):
+        """Replace the rows of queue_tags for the given items"""
+        conn.executemany("DELETE FROM queue_tags WHERE item_id = ?", [(item.id,) for item in items])
+        conn.executemany(
+            "INSERT OR IGNORE INTO queue_tags (item_id, tag) VALUES (?, ?)",
+            [(item.id, tag) for item in items for tag in item.tags]
+        )
+
+    @staticmethod
+    def _placeholders(values: List) -> str:
+        return ", ".join("?" for _ in values)
+
+    @staticmethod
+    def _item_to_row(item: models.QueueItem) -> tuple:
+        """Convert a queue item to a tuple matching QUEUE_COLUMNS"""
+        return (
+            item.id, item.file_path, item.file_name,
+            item.added_at, json.dumps(item.tags),
+            item.status, item.printer_name, item.started_at,
+            item.finished_at, item.error_message, item.file_hash
+        )
+
+    @staticmethod
+    def _row_to_item(row) -> models.QueueItem:
+        """Convert a row selected with QUEUE_COLUMNS to a queue item"""
+        return models.QueueItem(
+            id=row[0],
+            file_path=row[1],
+            file_name=row[2],
+            added_at=row[3],
+            tags=json.loads(row[4]),
+            status=row[5] or "todo",
+            printer_name=row[6],
+            started_at=row[7],
+            finished_at=row[8],
+            error_message=row[9],
+            file_hash=row[10]
+        )
     
     def save_queue(self, queue: List[models.QueueItem]) -> bool:
         """Save entire queue to database"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connect() as conn:
                 # Clear existing queue
                 conn.execute("DELETE FROM print_queue")
+                conn.execute("DELETE FROM queue_tags")
                 
                 # Insert new queue items
-                for i, item in enumerate(queue):
-                    conn.execute("""
-                        INSERT INTO print_queue 
-                        (id, file_path, file_name, added_at, tags, order_index, 
-                         status, printer_name, started_at, finished_at, error_message)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    """, (
-                        item.id, item.file_path, item.file_name, 
-                        item.added_at, json.dumps(item.tags), i,
-                        item.status, item.printer_name, item.started_at,
-                        item.finished_at, item.error_message
-                    ))
+                conn.executemany(f"""
+                    INSERT INTO print_queue ({QUEUE_COLUMNS}, order_index)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """, [self._item_to_row(item) + ((i + 1) * ORDER_GAP,) for i, item in enumerate(queue)])
+                self._write_item_tags(conn, queue)
+                
+                self._bump_queue_revision(conn)
                 
                 conn.commit()
             return True
@@ -121,40 +293,266 @@ class SQLiteDatabase:
     def load_queue(self) -> List[models.QueueItem]:
         """Load queue from database"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.execute("""
-                    SELECT id, file_path, file_name, added_at, tags,
-                           status, printer_name, started_at, finished_at, error_message
+            with self._connect() as conn:
+                cursor = conn.execute(f"""
+                    SELECT {QUEUE_COLUMNS}
                     FROM print_queue 
                     ORDER BY order_index
                 """)
-                
-                queue = []
-                for row in cursor.fetchall():
-                    queue.append(models.QueueItem(
-                        id=row[0],
-                        file_path=row[1],
-                        file_name=row[2],
-                        added_at=row[3],
-                        tags=json.loads(row[4]),
-                        status=row[5] or "todo",
-                        printer_name=row[6],
-                        started_at=row[7],
-                        finished_at=row[8],
-                        error_message=row[9]
-                    ))
-                
-                return queue
+                return [self._row_to_item(row) for row in cursor.fetchall()]
         except Exception as e:
             logger.error(f"Failed to load queue from database: {e}")
             return []
 
+    def get_queue_page(self, tags: List[str] = None, statuses: List[str] = None,
+                       printer_name: str = None, after: Tuple[int, str] = None,
+                       limit: int = None) -> Tuple[List[str], int, Optional[Tuple[int, str]]]:
+        """Get the ids of the items matching the filters, in queue order, the
+        total number of matching items and the (order_index, id) key of the last
+        returned item. Items match if they have at least one of the tags and one
+        of the statuses. `after` is the key of the last item of the previous page,
+        so pages are read by keyset instead of OFFSET scans, and keep going even
+        if that item left the queue since."""
+        conditions, params = [], []
+        if tags:
+            conditions.append(f"q.id IN (SELECT item_id FROM queue_tags WHERE tag IN ({self._placeholders(tags)}))")
+            params.extend(tags)
+        if statuses:
+            conditions.append(f"q.status IN ({self._placeholders(statuses)})")
+            params.extend(statuses)
+        if printer_name is not None:
+            conditions.append("q.printer_name = ?")
+            params.append(printer_name)
+        where = " AND ".join(conditions) or "1"
+
+        try:
+            with self._connect() as conn:
+                total = conn.execute(f"SELECT COUNT(*) FROM print_queue q WHERE {where}", params).fetchone()[0]
+
+                page_where, page_params = where, list(params)
+                if after is not None:
+                    page_where += " AND (q.order_index, q.id) > (?, ?)"
+                    page_params.extend(after)
+                rows = conn.execute(f"""
+                    SELECT q.order_index, q.id
+                    FROM print_queue q
+                    WHERE {page_where}
+                    ORDER BY q.order_index, q.id
+                    LIMIT ?
+                """, page_params + [limit if limit is not None else -1]).fetchall()
+                return [row[1] for row in rows], total, (tuple(rows[-1]) if rows else None)
+        except Exception as e:
+            logger.error(f"Failed to get queue page: {e}")
+            return [], 0, None
+
+    def get_all_tags(self) -> List[str]:
+        """Get all unique tags used in the queue"""
+        try:
+            with self._connect() as conn:
+                cursor = conn.execute("SELECT DISTINCT tag FROM queue_tags ORDER BY tag")
+                return [row[0] for row in cursor.fetchall()]
+        except Exception as e:
+            logger.error(f"Failed to get queue tags: {e}")
+            return []
+
+    def insert_queue_item(self, item: models.QueueItem) -> bool:
+        """Append a single item at the end of the queue"""
+        try:
+            with self._connect() as conn:
+                # MAX() is resolved through idx_queue_order, so appending stays cheap
+                conn.execute(f"""
+                    INSERT INTO print_queue ({QUEUE_COLUMNS}, order_index)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?,
+                            (SELECT COALESCE(MAX(order_index), 0) + ? FROM print_queue))
+                """, self._item_to_row(item) + (ORDER_GAP,))
+                self._write_item_tags(conn, [item])
+                self._bump_queue_revision(conn)
+                conn.commit()
+            return True
+        except Exception as e:
+            logger.error(f"Failed to insert queue item {item.id}: {e}")
+            return False
+
+    def insert_queue_items(self, items: List[models.QueueItem]) -> bool:
+        """Append several items at the end of the queue in a single transaction"""
+        try:
+            with self._connect() as conn:
+                last = conn.execute("SELECT COALESCE(MAX(order_index), 0) FROM print_queue").fetchone()[0]
+                conn.executemany(f"""
+                    INSERT INTO print_queue ({QUEUE_COLUMNS}, order_index)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """, [self._item_to_row(item) + (last + (i + 1) * ORDER_GAP,) for i, item in enumerate(items)])
+                self._write_item_tags(conn, items)
+                self._bump_queue_revision(conn)
+                conn.commit()
+            return True
+        except Exception as e:
+            logger.error(f"Failed to insert {len(items)} queue items: {e}")
+            return False
+
+    def update_queue_item(self, item: models.QueueItem) -> bool:
+        """Update every stored field of a single queue item (order is left untouched)"""
+        try:
+            with self._connect() as conn:
+                row = self._item_to_row(item)
+                cursor = conn.execute("""
+                    UPDATE print_queue
+                    SET file_path = ?, file_name = ?, added_at = ?, tags = ?,
+                        status = ?, printer_name = ?, started_at = ?,
+                        finished_at = ?, error_message = ?, file_hash = ?
+                    WHERE id = ?
+                """, row[1:] + row[:1])
+                if cursor.rowcount > 0:
+                    self._write_item_tags(conn, [item])
+                self._bump_queue_revision(conn)
+                conn.commit()
+                return cursor.rowcount > 0
+        except Exception as e:
+            logger.error(f"Failed to update queue item {item.id}: {e}")
+            return False
+
+    def delete_queue_items(self, item_ids: List[str]) -> int:
+        """Delete the given queue items, returns the number of deleted rows"""
+        if not item_ids:
+            return 0
+        try:
+            with self._connect() as conn:
+                params = [(item_id,) for item_id in item_ids]
+                cursor = conn.executemany("DELETE FROM print_queue WHERE id = ?", params)
+                deleted = cursor.rowcount
+                conn.executemany("DELETE FROM queue_tags WHERE item_id = ?", params)
+                self._bump_queue_revision(conn)
+                conn.commit()
+                return deleted
+        except Exception as e:
+            logger.error(f"Failed to delete queue items {item_ids}: {e}")
+            return 0
+
+    def delete_queue_item(self, item_id: str) -> bool:
+        """Delete a single queue item"""
+        return self.delete_queue_items([item_id]) > 0
+
+    def delete_queue_items_by_tags(self, tags: List[str]) -> List[str]:
+        """Delete the items having at least one of the tags, returns their ids"""
+        if not tags:
+            return []
+        try:
+            with self._connect() as conn:
+                item_ids = [row[0] for row in conn.execute(
+                    f"SELECT DISTINCT item_id FROM queue_tags WHERE tag IN ({self._placeholders(tags)})",
+                    tags
+                )]
+                params = [(item_id,) for item_id in item_ids]
+                conn.executemany("DELETE FROM print_queue WHERE id = ?", params)
+                conn.executemany("DELETE FROM queue_tags WHERE item_id = ?", params)
+                self._bump_queue_revision(conn)
+                conn.commit()
+                return item_ids
+        except Exception as e:
+            logger.error(f"Failed to delete queue items with tags {tags}: {e}")
+            return []
+
+    def clear_queue(self) -> bool:
+        """Delete every item of the queue"""
+        try:
+            with self._connect() as conn:
+                conn.execute("DELETE FROM print_queue")
+                conn.execute("DELETE FROM queue_tags")
+                self._bump_queue_revision(conn)
+                conn.commit()
+            return True
+        except Exception as e:
+            logger.error(f"Failed to clear queue in database: {e}")
+            return False
+
+    def update_queue_order(self, orders: List[Tuple[str, int]]) -> bool:
+        """Set the order_index of the given (item_id, order_index) pairs.
+        Rows already at the requested position are not rewritten."""
+        try:
+            with self._connect() as conn:
+                conn.executemany("""
+                    UPDATE print_queue SET order_index = ?
+                    WHERE id = ? AND order_index IS NOT ?
+                """, [(index, item_id, index) for item_id, index in orders])
+                self._bump_queue_revision(conn)
+                conn.commit()
+            return True
+        except Exception as e:
+            logger.error(f"Failed to update queue order: {e}")
+            return False
+
+    def move_queue_item(self, item_id: str, before_id: str = None, after_id: str = None) -> bool:
+        """Move an item right before or after another one by giving it an order_index
+        in the gap between its new neighbours. Only the moved row is written unless
+        the gap is exhausted, in which case the whole queue is respaced first."""
+        anchor_id = before_id if before_id is not None else after_id
+        try:
+            with self._connect() as conn:
+                found = conn.execute(
+                    "SELECT COUNT(*) FROM print_queue WHERE id IN (?, ?)", (item_id, anchor_id)
+                ).fetchone()[0]
+                if found != len({item_id, anchor_id}):
+                    return False
+                if item_id == anchor_id:
+                    return True
+
+                new_index = self._order_index_next_to(conn, item_id, anchor_id, before=before_id is not None)
+                if new_index is None:
+                    self._rebalance_order(conn)
+                    new_index = self._order_index_next_to(conn, item_id, anchor_id, before=before_id is not None)
+
+                conn.execute("UPDATE print_queue SET order_index = ? WHERE id = ?", (new_index, item_id))
+                self._bump_queue_revision(conn)
+                conn.commit()
+            return True
+        except Exception as e:
+            logger.error(f"Failed to move queue item {item_id}: {e}")
+            return False
+
+    @staticmethod
+    def _order_index_next_to(conn, item_id: str, anchor_id: str, before: bool):
+        """Find a free order_index right before/after the anchor, None if there is no room left"""
+        anchor_index = conn.execute(
+            "SELECT order_index FROM print_queue WHERE id = ?", (anchor_id,)
+        ).fetchone()[0]
+        if anchor_index is None:
+            return None
+
+        if before:
+            neighbour_index = conn.execute(
+                "SELECT MAX(order_index) FROM print_queue WHERE order_index < ? AND id != ?",
+                (anchor_index, item_id)
+            ).fetchone()[0]
+            if neighbour_index is None:
+                return anchor_index - ORDER_GAP
+        else:
+            neighbour_index = conn.execute(
+                "SELECT MIN(order_index) FROM print_queue WHERE order_index > ? AND id != ?",
+                (anchor_index, item_id)
+            ).fetchone()[0]
+            if neighbour_index is None:
+                return anchor_index + ORDER_GAP
+
+        if abs(anchor_index - neighbour_index) < 2:
+            return None
+        return (anchor_index + neighbour_index) // 2
+
+    @staticmethod
+    def _rebalance_order(conn):
+        """Respace every order_index by ORDER_GAP, keeping the current order"""
+        item_ids = [row[0] for row in conn.execute("SELECT id FROM print_queue ORDER BY order_index, rowid")]
+        conn.executemany(
+            "UPDATE print_queue SET order_index = ? WHERE id = ?",
+            [((i + 1) * ORDER_GAP, item_id) for i, item_id in enumerate(item_ids)]
+        )
+        logger.debug(f"Rebalanced order of {len(item_ids)} queue items")
+
     def update_queue_item_status(self, item_id: str, status: str, printer_name: str = None, 
                                 started_at: str = None, finished_at: str = None, 
                                 error_message: str = None) -> bool:
         """Update the status and related fields of a specific queue item"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connect() as conn:
                 conn.execute("""
                     UPDATE print_queue 
                     SET status = ?, printer_name = ?, started_at = ?, 
@@ -162,38 +560,276 @@ class SQLiteDatabase:
                     WHERE id = ?
                 """, (status, printer_name, started_at, finished_at, error_message, item_id))
                 
+                self._bump_queue_revision(conn)
+                
                 conn.commit()
                 return True
         except Exception as e:
             logger.error(f"Failed to update queue item {item_id}: {e}")
             return False
 
+    def update_queue_items_status(self, item_ids: List[str], status: str, printer_name: str = None,
+                                  started_at: str = None, finished_at: str = None,
+                                  error_message: str = None, keep_assignment: bool = False) -> int:
+        """Set the same status on several queue items in a single transaction,
+        keep_assignment leaves each item's printer_name and started_at as they are.
+        Returns the number of updated rows"""
+        if not item_ids:
+            return 0
+        try:
+            with self._connect() as conn:
+                cursor = conn.executemany("""
+                    UPDATE print_queue
+                    SET status = ?, printer_name = CASE WHEN ? THEN printer_name ELSE ? END,
+                        started_at = CASE WHEN ? THEN started_at ELSE ? END,
+                        finished_at = ?, error_message = ?
+                    WHERE id = ?
+                """, [(status, keep_assignment, printer_name, keep_assignment, started_at,
+                       finished_at, error_message, item_id)
+                      for item_id in item_ids])
+                updated = cursor.rowcount
+                self._bump_queue_revision(conn)
+                conn.commit()
+                return updated
+        except Exception as e:
+            logger.error(f"Failed to update the status of {len(item_ids)} queue items: {e}")
+            return 0
+
+    def archive_queue_items(self, statuses: List[str], finished_before: str) -> List[str]:
+        """Move the items in one of the statuses that finished before the given
+        ISO date to print_history, returns the ids of the archived items"""
+        try:
+            with self._connect() as conn:
+                item_ids = [row[0] for row in conn.execute(f"""
+                    SELECT id FROM print_queue
+                    WHERE status IN ({self._placeholders(statuses)}) AND finished_at < ?
+                """, statuses + [finished_before])]
+                if not item_ids:
+                    return []
+
+                archived_at = datetime.now().isoformat()
+                params = [(item_id,) for item_id in item_ids]
+                conn.executemany(f"""
+                    INSERT INTO print_history ({QUEUE_COLUMNS}, archived_at)
+                    SELECT {QUEUE_COLUMNS}, ? FROM print_queue WHERE id = ?
+                """, [(archived_at, item_id) for item_id in item_ids])
+                conn.executemany("DELETE FROM print_queue WHERE id = ?", params)
+                conn.executemany("DELETE FROM queue_tags WHERE item_id = ?", params)
+                self._bump_queue_revision(conn)
+                conn.commit()
+                return item_ids
+        except Exception as e:
+            logger.error(f"Failed to archive completed queue items: {e}")
+            return []
+
+    def load_history(self, statuses: List[str] = None, printer_name: str = None,
+                     before: int = None, limit: int = 100) -> List[models.HistoryItem]:
+        """Load archived items, most recently archived first. `before` is the
+        history_id of the last item of the previous page."""
+        conditions, params = [], []
+        if statuses:
+            conditions.append(f"status IN ({self._placeholders(statuses)})")
+            params.extend(statuses)
+        if printer_name is not None:
+            conditions.append("printer_name = ?")
+            params.append(printer_name)
+        if before is not None:
+            conditions.append("history_id < ?")
+            params.append(before)
+        where = " AND ".join(conditions) or "1"
+
+        try:
+            with self._connect() as conn:
+                cursor = conn.execute(f"""
+                    SELECT {QUEUE_COLUMNS}, archived_at, history_id
+                    FROM print_history
+                    WHERE {where}
+                    ORDER BY history_id DESC
+                    LIMIT ?
+                """, params + [limit])
+                return [
+                    models.HistoryItem(
+                        **self._row_to_item(row).model_dump(),
+                        archived_at=row[11],
+                        history_id=row[12]
+                    )
+                    for row in cursor.fetchall()
+                ]
+        except Exception as e:
+            logger.error(f"Failed to load print history: {e}")
+            return []
+
+    def purge_history(self, finished_before: str) -> int:
+        """Delete history entries that finished before the given ISO date"""
+        try:
+            with self._connect() as conn:
+                cursor = conn.execute("DELETE FROM print_history WHERE finished_at < ?", (finished_before,))
+                conn.commit()
+                return cursor.rowcount
+        except Exception as e:
+            logger.error(f"Failed to purge print history: {e}")
+            return 0
+
+    def compact(self) -> bool:
+        """Give the space freed by deleted rows back to the filesystem"""
+        try:
+            conn = self._connect()
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            conn.execute("VACUUM")
+            return True
+        except Exception as e:
+            logger.error(f"Failed to compact database: {e}")
+            return False
+
     def get_queue_item_by_id(self, item_id: str) -> models.QueueItem:
         """Get a specific queue item by ID"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.execute("""
-                    SELECT id, file_path, file_name, added_at, tags,
-                           status, printer_name, started_at, finished_at, error_message
+            with self._connect() as conn:
+                cursor = conn.execute(f"""
+                    SELECT {QUEUE_COLUMNS}
                     FROM print_queue 
                     WHERE id = ?
                 """, (item_id,))
                 
                 row = cursor.fetchone()
                 if row:
-                    return models.QueueItem(
-                        id=row[0],
-                        file_path=row[1],
-                        file_name=row[2],
-                        added_at=row[3],
-                        tags=json.loads(row[4]),
-                        status=row[5] or "todo",
-                        printer_name=row[6],
-                        started_at=row[7],
-                        finished_at=row[8],
-                        error_message=row[9]
-                    )
+                    return self._row_to_item(row)
                 return None
         except Exception as e:
             logger.error(f"Failed to get queue item {item_id}: {e}")
             return None
+
+    def save_gcode_analysis(self, analysis: GCodeAnalysis) -> bool:
+        """Store the analysis of a file, replacing any previous one"""
+        try:
+            with self._connect() as conn:
+                conn.execute("""
+                    INSERT OR REPLACE INTO gcode_analysis
+                    (file_path, mtime, size, line_count, estimated_time, filament_used, layers, time_table)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                """, (
+                    analysis.file_path, analysis.mtime, analysis.size, analysis.line_count,
+                    analysis.estimated_time, analysis.filament_used,
+                    analysis.layers.tobytes(), analysis.time_table.tobytes()
+                ))
+                conn.commit()
+                return True
+        except Exception as e:
+            logger.error(f"Failed to save analysis of {analysis.file_path}: {e}")
+            return False
+
+    def load_gcode_analysis(self, file_path: str, mtime: float, size: int) -> Optional[GCodeAnalysis]:
+        """Get the analysis of a file, None if missing or the file changed since"""
+        try:
+            with self._connect() as conn:
+                row = conn.execute("""
+                    SELECT line_count, estimated_time, filament_used, layers, time_table
+                    FROM gcode_analysis
+                    WHERE file_path = ? AND mtime = ? AND size = ?
+                """, (file_path, mtime, size)).fetchone()
+                if not row:
+                    return None
+
+                layers, time_table = array("Q"), array("d")
+                layers.frombytes(row[3])
+                time_table.frombytes(row[4])
+                return GCodeAnalysis(
+                    file_path=file_path, mtime=mtime, size=size,
+                    line_count=row[0], estimated_time=row[1], filament_used=row[2],
+                    layers=layers, time_table=time_table
+                )
+        except Exception as e:
+            logger.error(f"Failed to load analysis of {file_path}: {e}")
+            return None
+
+    def delete_gcode_analysis(self, path: str) -> int:
+        """Drop the analysis of a file, or of every file under a folder"""
+        condition, params = self._path_condition("file_path", path)
+        try:
+            with self._connect() as conn:
+                cursor = conn.execute(f"DELETE FROM gcode_analysis WHERE {condition}", params)
+                conn.commit()
+                return cursor.rowcount
+        except Exception as e:
+            logger.error(f"Failed to delete analysis of {path}: {e}")
+            return 0
+
+    def rename_gcode_analysis(self, old_path: str, new_path: str) -> bool:
+        """Follow a renamed or moved file or folder in the cached analyses"""
+        condition, params = self._path_condition("file_path", old_path)
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    f"UPDATE OR REPLACE gcode_analysis SET file_path = ? || substr(file_path, ?) WHERE {condition}",
+                    (new_path, len(old_path) + 1) + params
+                )
+                conn.commit()
+                return True
+        except Exception as e:
+            logger.error(f"Failed to rename analysis of {old_path}: {e}")
+            return False
+
+    @staticmethod
+    def _path_condition(column: str, path: str) -> Tuple[str, tuple]:
+        """SQL condition matching a path and everything under it when it's a folder"""
+        prefix = path.rstrip("/") + "/"
+        return f"({column} = ? OR substr({column}, 1, ?) = ?)", (path, len(prefix), prefix)
+
+    def set_file_hash(self, path: str, digest: str) -> bool:
+        """Record the content hash of a stored file"""
+        try:
+            with self._connect() as conn:
+                conn.execute("INSERT OR REPLACE INTO file_hashes (path, hash) VALUES (?, ?)", (path, digest))
+                conn.commit()
+                return True
+        except Exception as e:
+            logger.error(f"Failed to record hash of {path}: {e}")
+            return False
+
+    def get_file_hash(self, path: str) -> Optional[str]:
+        """Get the content hash of a file, None if it wasn't stored through the blob store"""
+        try:
+            with self._connect() as conn:
+                row = conn.execute("SELECT hash FROM file_hashes WHERE path = ?", (path,)).fetchone()
+                return row[0] if row else None
+        except Exception as e:
+            logger.error(f"Failed to get hash of {path}: {e}")
+            return None
+
+    def get_paths_by_hash(self, digest: str) -> List[str]:
+        """Get every path holding the given content"""
+        try:
+            with self._connect() as conn:
+                cursor = conn.execute("SELECT path FROM file_hashes WHERE hash = ? ORDER BY path", (digest,))
+                return [row[0] for row in cursor.fetchall()]
+        except Exception as e:
+            logger.error(f"Failed to get paths of {digest}: {e}")
+            return []
+
+    def delete_file_hashes(self, path: str) -> List[str]:
+        """Forget the hashes of a file or of every file under a folder, returns the removed hashes"""
+        condition, params = self._path_condition("path", path)
+        try:
+            with self._connect() as conn:
+                digests = [row[0] for row in conn.execute(f"SELECT DISTINCT hash FROM file_hashes WHERE {condition}", params)]
+                conn.execute(f"DELETE FROM file_hashes WHERE {condition}", params)
+                conn.commit()
+                return digests
+        except Exception as e:
+            logger.error(f"Failed to delete hashes of {path}: {e}")
+            return []
+
+    def rename_file_hashes(self, old_path: str, new_path: str) -> bool:
+        """Follow a renamed or moved file or folder in the hash index"""
+        condition, params = self._path_condition("path", old_path)
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    f"UPDATE file_hashes SET path = ? || substr(path, ?) WHERE {condition}",
+                    (new_path, len(old_path) + 1) + params
+                )
+                conn.commit()
+                return True
+        except Exception as e:
+            logger.error(f"Failed to rename hashes of {old_path}: {e}")
+            return False
@@ -1,86 +1,283 @@
+import base64
+import dataclasses
+import hashlib
+import io
+import json
 import os
 import shutil
-from datetime import datetime
+import sys
+import tempfile
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timedelta
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import BinaryIO, Dict, List, Optional, Tuple, Union
 import uuid
 
+import pydantic
+
 from . import models, utils
 from .utils import logger
-from .database import SQLiteDatabase
+from .database import ORDER_GAP, SQLiteDatabase
+from .gcode import GCodeAnalysis, analyze_gcode
+
+# content-addressed copy of every uploaded file, hidden from the file tree
+BLOB_FOLDER = ".blobs"
+UPLOAD_CHUNK_SIZE = 1 << 20  # bytes read at once when storing an upload
+FILE_LIST_ADAPTER = pydantic.TypeAdapter(List[models.File])
+
+
+class BlobWriter:
+    """Upload being written to a temporary file of the blob store, hashed on the way"""
+
+    def __init__(self, blob_folder: Path):
+        blob_folder.mkdir(parents=True, exist_ok=True)
+        fd, self.tmp_path = tempfile.mkstemp(dir=blob_folder, suffix=".tmp")
+        self._file = os.fdopen(fd, 'wb')
+        self._sha256 = hashlib.sha256()
+        self.size = 0
+
+    def write(self, chunk: bytes) -> bool:
+        """Append a chunk, False (and nothing written) once the upload exceeds MAX_UPLOAD_SIZE"""
+        self.size += len(chunk)
+        if utils.MAX_UPLOAD_SIZE and self.size > utils.MAX_UPLOAD_SIZE:
+            return False
+        self._sha256.update(chunk)
+        self._file.write(chunk)
+        return True
+
+    def close(self) -> str:
+        """Flush the written content, returns its hash"""
+        self._file.close()
+        return self._sha256.hexdigest()
+
+    def discard(self):
+        """Drop the temporary file, if it wasn't moved to the store"""
+        self._file.close()
+        if os.path.exists(self.tmp_path):
+            os.unlink(self.tmp_path)
 
 
 class FileManager:
-    """Manages file operations and maintains file structure"""
+    """Manages file operations and maintains file structure.
+
+    Uploaded files are stored once per content in BLOB_FOLDER and hard linked
+    into the visible tree, so they must be replaced (as uploads do) rather
+    than modified in place, which would change every copy."""
     
-    def __init__(self, base_path: str = None):
+    def __init__(self, base_path: str = None, db_path: str = "/data/makerprint.db"):
         self.base_path = Path(base_path or utils.GCODEFOLDER)
         self.base_path.mkdir(parents=True, exist_ok=True)
+        self.db = SQLiteDatabase(db_path)
+        # single background thread, analysing several files at once would only compete for disk
+        self._analysis_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="gcode-analysis")
+
+        # in-memory index of the tree, built on first use then kept up to date
+        # by our own changes and refresh_index for changes made outside the api
+        self._index_lock = threading.RLock()
+        self._root: Optional[models.FileNode] = None
+        self._nodes: Dict[str, models.FileNode] = {}  # relative path -> node
+        self._folder_mtimes: Dict[str, int] = {}  # relative path -> st_mtime_ns at the last scan
+        self._index_revision = 0
+        self._index_token = uuid.uuid4().hex[:8]  # keeps ETags from another process run apart
+        self._rendered: Dict[str, Tuple[int, bytes]] = {}
         
-    def _get_file_info(self, file_path: Path) -> models.File:
-        """Get file information for a single file"""
-        stat = file_path.stat()
-        relative_path = str(file_path.relative_to(self.base_path))
-        
-        return models.File(
-            name=file_path.name,
-            path=relative_path,
-            type="folder" if file_path.is_dir() else "file",
-            size=stat.st_size if file_path.is_file() else None,
-            modified=datetime.fromtimestamp(stat.st_mtime).isoformat(),
-            tags=[]
-        )
-    
-    def _build_file_tree(self, directory: Path) -> models.FileNode:
-        """Recursively build file tree structure"""
-        stat = directory.stat()
-        relative_path = str(directory.relative_to(self.base_path))
-        
-        node = models.FileNode(
-            name=directory.name,
-            path=relative_path,
-            type="folder" if directory.is_dir() else "file",
-            size=stat.st_size if directory.is_file() else None,
-            modified=datetime.fromtimestamp(stat.st_mtime).isoformat(),
-            children=[] if directory.is_dir() else None,
-            tags=[]
-        )
-        
-        if directory.is_dir():
+    def _child_path(self, parent: str, name: str) -> str:
+        return name if parent == "." else f"{parent}/{name}"
+
+    def _drop_from_index(self, node: models.FileNode):
+        """Forget a node and everything under it"""
+        self._nodes.pop(node.path, None)
+        self._folder_mtimes.pop(node.path, None)
+        for child in node.children or []:
+            self._drop_from_index(child)
+
+    def _scan_folder(self, node: models.FileNode) -> bool:
+        """Bring the children of a folder node in line with the disk with a single
+        scandir pass, new subfolders are scanned recursively. Returns whether
+        anything changed."""
+        full_path = self.base_path / node.path
+        try:
+            # read before listing, a change made during the scan is seen by the next one
+            folder_stat = full_path.stat()
+            with os.scandir(full_path) as it:
+                entries = list(it)
+        except FileNotFoundError:
+            return False  # removed meanwhile, its parent drops it
+        except PermissionError:
+            logger.warning(f"Permission denied accessing {full_path}")
+            return False
+
+        existing = {child.name: child for child in node.children}
+        children = []
+        modified = datetime.fromtimestamp(folder_stat.st_mtime).isoformat()
+        changed = node.modified != modified
+        node.modified = modified
+        for entry in entries:
+            if entry.name.startswith('.'):
+                continue  # skip hidden files
             try:
-                for child in sorted(directory.iterdir()):
-                    if child.name.startswith('.'):
-                        continue  # skip hidden files
-                    # Include directories or gcode files
-                    if child.is_dir() or child.name.endswith('.gcode'):
-                        node.children.append(self._build_file_tree(child))
-            except PermissionError:
-                logger.warning(f"Permission denied accessing {directory}")
-                
-        return node
-    
+                is_dir = entry.is_dir()
+                # Include directories or gcode files
+                if not is_dir and not entry.name.lower().endswith('.gcode'):
+                    continue
+                stat = entry.stat()
+            except OSError:
+                continue
+
+            node_type = "folder" if is_dir else "file"
+            size = None if is_dir else stat.st_size
+            modified = datetime.fromtimestamp(stat.st_mtime).isoformat()
+            child = existing.pop(entry.name, None)
+            if child is not None and child.type == node_type:
+                if child.size != size or child.modified != modified:
+                    child.size, child.modified = size, modified
+                    changed = True
+                children.append(child)
+                continue
+
+            if child is not None:
+                self._drop_from_index(child)
+            child = models.FileNode(
+                name=entry.name,
+                path=self._child_path(node.path, entry.name),
+                type=node_type,
+                size=size,
+                modified=modified,
+                children=[] if is_dir else None,
+                tags=[]
+            )
+            self._nodes[child.path] = child
+            if is_dir:
+                self._scan_folder(child)
+            children.append(child)
+            changed = True
+
+        for child in existing.values():
+            self._drop_from_index(child)
+            changed = True
+
+        children.sort(key=lambda child: child.name)
+        node.children = children
+        self._folder_mtimes[node.path] = folder_stat.st_mtime_ns
+        return changed
+
+    def _ensure_index(self):
+        """Build the index on first use"""
+        with self._index_lock:
+            if self._root is not None:
+                return
+            stat = self.base_path.stat()
+            self._root = models.FileNode(
+                name=self.base_path.name,
+                path=".",
+                type="folder",
+                modified=datetime.fromtimestamp(stat.st_mtime).isoformat(),
+                children=[],
+                tags=[]
+            )
+            self._nodes = {".": self._root}
+            self._scan_folder(self._root)
+            self._index_revision += 1
+
+    def refresh_index(self) -> bool:
+        """Pick up changes made outside the api. Only folders whose mtime moved are
+        listed again, which catches files being added, removed or renamed."""
+        with self._index_lock:
+            if self._root is None:
+                self._ensure_index()
+                return True
+
+            changed = False
+            for path in sorted(self._folder_mtimes, key=lambda path: path.count("/")):
+                node = self._nodes.get(path)
+                if node is None:
+                    continue  # dropped by the rescan of its parent
+                try:
+                    mtime = (self.base_path / path).stat().st_mtime_ns
+                except OSError:
+                    continue
+                if mtime != self._folder_mtimes.get(path):
+                    changed |= self._scan_folder(node)
+            if changed:
+                self._index_revision += 1
+            return changed
+
+    def _index_changed_at(self, relative_path: str):
+        """Rescan the folder holding relative_path after one of our own changes"""
+        with self._index_lock:
+            if self._root is None:
+                return
+            folder = os.path.dirname(relative_path.strip("/")) or "."
+            while folder not in self._nodes:
+                folder = os.path.dirname(folder) or "."
+            if self._scan_folder(self._nodes[folder]):
+                self._index_revision += 1
+
+    def get_index_etag(self) -> str:
+        """ETag of the current file index. Read without the index lock, so it
+        doesn't wait for a refresh walking the tree: a refresh bumps the
+        revision once it is done, until then the previous ETag still holds."""
+        if self._root is None:
+            self._ensure_index()
+        return f'"{self._index_token}-{self._index_revision}"'
+
+    def _render_index(self, kind: str, render) -> bytes:
+        """JSON body built once per index revision"""
+        with self._index_lock:
+            self._ensure_index()
+            cached = self._rendered.get(kind)
+            if cached is None or cached[0] != self._index_revision:
+                cached = (self._index_revision, render())
+                self._rendered[kind] = cached
+            return cached[1]
+
+    def _collect_files(self) -> List[models.File]:
+        return [
+            models.File(name=node.name, path=node.path, type="file",
+                        size=node.size, modified=node.modified, tags=[])
+            for node in self._nodes.values() if node.type == "file"
+        ]
+
     def get_file_tree(self) -> models.FileNode:
         """Get the complete file tree structure"""
-        return self._build_file_tree(self.base_path)
+        with self._index_lock:
+            self._ensure_index()
+            return self._root.model_copy(deep=True)
     
     def get_files_flat(self) -> List[models.File]:
         """Get a flat list of all files (no folders)"""
-        files = []
-        
-        def collect_files(directory: Path):
-            try:
-                for item in directory.iterdir():
-                    if item.name.startswith('.'):
-                        continue
-                    if item.is_file() and item.suffix.lower() == '.gcode':
-                        files.append(self._get_file_info(item))
-                    elif item.is_dir():
-                        collect_files(item)
-            except PermissionError:
-                logger.warning(f"Permission denied accessing {directory}")
-        
-        collect_files(self.base_path)
-        return files
+        with self._index_lock:
+            self._ensure_index()
+            return self._collect_files()
+
+    def get_file_tree_json(self) -> bytes:
+        """Serialized file tree, cached until the index changes"""
+        return self._render_index("tree", lambda: self._root.model_dump_json().encode())
+
+    def _subtree_to_dict(self, node: models.FileNode, depth: int) -> dict:
+        data = node.model_dump(exclude={"children"})
+        if node.children is None or depth <= 0:
+            data["children"] = None  # a folder left unexpanded has no children list
+        else:
+            data["children"] = [self._subtree_to_dict(child, depth - 1) for child in node.children]
+        return data
+
+    def get_subtree_json(self, path: str, depth: int = None) -> Optional[bytes]:
+        """Serialized subtree rooted at path, folders deeper than depth are left
+        unexpanded. None if path isn't an indexed folder or file."""
+        path = os.path.normpath(path.strip("/") or ".")
+        with self._index_lock:
+            self._ensure_index()
+            node = self._nodes.get(path)
+            if node is None:
+                return None
+            data = self._subtree_to_dict(node, depth if depth is not None else sys.maxsize)
+        return json.dumps(data).encode()
+
+    def get_files_flat_json(self) -> bytes:
+        """Serialized flat file list, cached until the index changes"""
+        return self._render_index("list", lambda: FILE_LIST_ADAPTER.dump_json(self._collect_files()))
     
     def create_folder(self, folder_path: str) -> bool:
         """Create a new folder"""
@@ -88,6 +285,7 @@ class FileManager:
             full_path = self.base_path / folder_path
             full_path.mkdir(parents=True, exist_ok=True)
             logger.info(f"Created folder: {folder_path}")
+            self._index_changed_at(str(full_path.relative_to(self.base_path)))
             return True
         except Exception as e:
             logger.error(f"Failed to create folder {folder_path}: {e}")
@@ -106,6 +304,9 @@ class FileManager:
             else:
                 shutil.rmtree(full_path)
                 logger.info(f"Deleted folder: {item_path}")
+            self.db.delete_gcode_analysis(item_path)
+            self.release_blobs(self.db.delete_file_hashes(item_path))
+            self._index_changed_at(str(full_path.relative_to(self.base_path)))
             return True
         except Exception as e:
             logger.error(f"Failed to delete {item_path}: {e}")
@@ -121,6 +322,7 @@ class FileManager:
             new_full_path = old_full_path.parent / new_name
             old_full_path.rename(new_full_path)
             logger.info(f"Renamed {old_path} to {new_name}")
+            self._follow_rename(old_path, new_full_path)
             return True
         except Exception as e:
             logger.error(f"Failed to rename {old_path} to {new_name}: {e}")
@@ -153,27 +355,107 @@ class FileManager:
             # Move the item
             source_path.rename(target_path)
             logger.info(f"Moved {item_path} to {new_folder_path}")
+            self._follow_rename(item_path, target_path)
             return True
         except Exception as e:
             logger.error(f"Failed to move {item_path} to {new_folder_path}: {e}")
             return False
     
-    def save_uploaded_file(self, content: bytes, filename: str, folder_path: str = "") -> bool:
-        """Save an uploaded file to the specified folder"""
+    def save_uploaded_file(self, content: Union[bytes, BinaryIO], filename: str, folder_path: str = "") -> bool:
+        """Save an uploaded file to the specified folder, content is either bytes
+        or a file object which is read in chunks"""
+        try:
+            digest = self._store_blob(io.BytesIO(content) if isinstance(content, bytes) else content)
+        except Exception as e:
+            logger.error(f"Failed to save uploaded file {filename}: {e}")
+            return False
+        return digest is not None and self.save_blob(digest, filename, folder_path)
+
+    def save_blob(self, digest: str, filename: str, folder_path: str = "") -> bool:
+        """Make a stored blob visible as a file of the specified folder"""
         try:
             target_dir = self.base_path / folder_path
             target_dir.mkdir(parents=True, exist_ok=True)
             
             file_path = target_dir / filename
-            with open(file_path, 'wb') as f:
-                f.write(content)
+            relative_path = str(file_path.relative_to(self.base_path))
+            previous_digest = self.db.get_file_hash(relative_path)
+
+            self._link_blob(digest, file_path)
+            self.db.set_file_hash(relative_path, digest)
+            if previous_digest and previous_digest != digest:
+                self.release_blobs([previous_digest])
             
             logger.info(f"Saved uploaded file: {folder_path}/{filename}")
+            self._index_changed_at(relative_path)
+            self.schedule_analysis(relative_path)
             return True
         except Exception as e:
             logger.error(f"Failed to save uploaded file {filename}: {e}")
             return False
     
+    def _blob_path(self, digest: str) -> Path:
+        return self.base_path / BLOB_FOLDER / digest[:2] / digest
+
+    def open_blob(self) -> "BlobWriter":
+        """Start writing an upload to the blob store, finish it with commit_blob"""
+        return BlobWriter(self.base_path / BLOB_FOLDER)
+
+    def commit_blob(self, writer: "BlobWriter") -> str:
+        """Move a fully written blob to its place in the store, returns its hash"""
+        try:
+            digest = writer.close()
+            blob_path = self._blob_path(digest)
+            if not blob_path.exists():
+                blob_path.parent.mkdir(parents=True, exist_ok=True)
+                os.replace(writer.tmp_path, blob_path)
+            return digest
+        finally:
+            writer.discard()
+
+    def _store_blob(self, source: BinaryIO) -> Optional[str]:
+        """Copy source to the blob store in chunks, hashing it on the way.
+        Returns its hash, or None if it exceeds MAX_UPLOAD_SIZE"""
+        writer = self.open_blob()
+        try:
+            while chunk := source.read(UPLOAD_CHUNK_SIZE):
+                if not writer.write(chunk):
+                    logger.error(f"Upload exceeds the maximum size of {utils.MAX_UPLOAD_SIZE} bytes")
+                    return None
+            return self.commit_blob(writer)
+        finally:
+            writer.discard()
+
+    def _link_blob(self, digest: str, file_path: Path):
+        """Point file_path to a blob, with a hard link when the filesystem allows it"""
+        tmp_path = file_path.with_name(f".{file_path.name}.{uuid.uuid4().hex}.tmp")
+        try:
+            os.link(self._blob_path(digest), tmp_path)
+        except OSError:
+            shutil.copyfile(self._blob_path(digest), tmp_path)
+        os.replace(tmp_path, file_path)
+
+    def release_blobs(self, digests: List[str]):
+        """Delete the blobs no visible file refers to anymore"""
+        for digest in digests:
+            if self.db.get_paths_by_hash(digest):
+                continue
+            try:
+                self._blob_path(digest).unlink(missing_ok=True)
+            except OSError as e:
+                logger.warning(f"Failed to delete blob {digest}: {e}")
+
+    def get_file_hash(self, relative_path: str) -> Optional[str]:
+        """Get the content hash of an uploaded file"""
+        return self.db.get_file_hash(relative_path)
+
+    def find_file_by_hash(self, digest: str) -> Optional[str]:
+        """Get the path of a file currently holding the given content"""
+        for path in self.db.get_paths_by_hash(digest):
+            if (self.base_path / path).is_file():
+                return path
+        return None
+
     def get_file_path(self, relative_path: str) -> Path:
         """Get the absolute path for a relative file path"""
         return self.base_path / relative_path
@@ -182,159 +464,409 @@ class FileManager:
         """Check if a file exists"""
         return (self.base_path / relative_path).exists()
 
+    def _follow_rename(self, old_path: str, new_full_path: Path):
+        """Update the file index, the hash index and the cached analysis of a renamed or moved item"""
+        new_path = str(new_full_path.relative_to(self.base_path))
+        self._index_changed_at(str((self.base_path / old_path).relative_to(self.base_path)))
+        self._index_changed_at(new_path)
+        self.db.rename_file_hashes(old_path, new_path)
+        # a rename keeps mtime and size, so the analyses of the item and its children stay valid
+        self.db.rename_gcode_analysis(old_path, new_path)
+        if new_full_path.is_file():
+            self.schedule_analysis(new_path)
+
+    def get_analysis(self, relative_path: str) -> Optional[GCodeAnalysis]:
+        """Get the cached analysis of a file, None if it wasn't analysed since its last change"""
+        try:
+            stat = (self.base_path / relative_path).stat()
+        except OSError:
+            return None
+        return self.db.load_gcode_analysis(relative_path, stat.st_mtime, stat.st_size)
+
+    def analyze_file(self, relative_path: str) -> Optional[GCodeAnalysis]:
+        """Analyse a file unless a valid analysis is already cached"""
+        analysis = self.get_analysis(relative_path)
+        if analysis:
+            return analysis
+
+        # identical content uploaded elsewhere was already analysed, reuse it
+        digest = self.db.get_file_hash(relative_path)
+        for other_path in self.db.get_paths_by_hash(digest) if digest else []:
+            analysis = self.get_analysis(other_path)
+            if analysis:
+                stat = (self.base_path / relative_path).stat()
+                analysis = dataclasses.replace(
+                    analysis, file_path=relative_path, mtime=stat.st_mtime, size=stat.st_size
+                )
+                self.db.save_gcode_analysis(analysis)
+                return analysis
+
+        try:
+            analysis = analyze_gcode(str(self.base_path / relative_path), relative_path)
+        except FileNotFoundError:
+            logger.debug(f"{relative_path} was removed before it could be analysed")
+            return None
+        except Exception as e:
+            logger.error(f"Failed to analyse {relative_path}: {e}")
+            return None
+
+        self.db.save_gcode_analysis(analysis)
+        logger.info(f"Analysed {relative_path}: {analysis.line_count} lines, "
+                    f"{len(analysis.layers)} layers, ~{analysis.estimated_time:.0f}s")
+        return analysis
+
+    def schedule_analysis(self, relative_path: str) -> Future:
+        """Analyse a file in the background"""
+        return self._analysis_executor.submit(self.analyze_file, relative_path)
+
 
 class PrintQueueManager:
     """Manages a print queue for all printers with SQLite persistence"""
+    ARCHIVE_STATUSES = ["success", "finished", "failed"]
     
     def __init__(self, db_path: str = "/data/makerprint.db"):
         self.db = SQLiteDatabase(db_path)
         self._queue: List[models.QueueItem] = []
+        self._items_by_id: Dict[str, models.QueueItem] = {}
+        self._revision = -1  # database revision the in-memory queue matches
+        self._etag_token = uuid.uuid4().hex[:8]  # keeps ETags from another process run apart
+        # the api, its maintenance thread and in-process printer workers all use the queue
+        self._lock = threading.RLock()
         self._load_queue()
     
     def _load_queue(self):
-        """Load queue from database on startup"""
+        """Load the whole queue from database"""
+        # read the revision first, a concurrent write only makes the next check reload again
+        revision = self.db.get_queue_revision()
         self._queue = self.db.load_queue()
+        self._items_by_id = {item.id: item for item in self._queue}
+        self._revision = revision
+
+    def get_etag(self) -> Optional[str]:
+        """ETag of the queue content, None if its revision can't be read"""
+        revision = self.db.get_queue_revision()
+        if revision < 0:
+            return None
+        return f'"{self._etag_token}-{revision}"'
+
+    def _refresh_if_stale(self):
+        """Reload the queue only if another process wrote to the database"""
+        if self.db.get_queue_revision() != self._revision:
+            self._load_queue()
+
+    def _after_write(self):
+        """Keep the in-memory queue authoritative after one of our own writes.
+        Each write bumps the revision by exactly one, any other gap means
+        another process wrote too (or our write failed) and we must reload."""
+        revision = self.db.get_queue_revision()
+        if revision == self._revision + 1:
+            self._revision = revision
+        else:
+            self._revision = -1
+
+    def _position(self, item: models.QueueItem) -> int:
+        """Index of an item of the in-memory queue. Compares identities, list.index
+        would run the pydantic __eq__ on every item before it."""
+        return next(i for i, queued in enumerate(self._queue) if queued is item)
     
-    def _save_queue(self):
-        """Save current queue to database"""
-        success = self.db.save_queue(self._queue)
-        if not success:
-            logger.error("Failed to save queue to database")
-        return success
-    
-    def add_to_queue(self, file_path: str, file_name: str, tags: List[str] = None) -> str:
+    def add_to_queue(self, file_path: str, file_name: str, tags: List[str] = None,
+                     file_hash: str = None) -> str:
         """Add a file to the queue"""
-        if tags is None:
-            tags = []
+        with self._lock:
+            if tags is None:
+                tags = []
             
-        queue_item = models.QueueItem(
-            id=str(uuid.uuid4()),
-            file_path=file_path,
-            file_name=file_name,
-            added_at=datetime.now().isoformat(),
-            tags=tags
-        )
+            self._refresh_if_stale()
+            queue_item = models.QueueItem(
+                id=str(uuid.uuid4()),
+                file_path=file_path,
+                file_name=file_name,
+                added_at=datetime.now().isoformat(),
+                tags=tags,
+                file_hash=file_hash
+            )
         
-        self._queue.append(queue_item)
-        self._save_queue()
-        logger.debug(f"Added {file_name} to queue with tags: {tags}")
-        return queue_item.id
+            if not self.db.insert_queue_item(queue_item):
+                logger.error(f"Failed to add {file_name} to queue in database")
+            self._queue.append(queue_item)
+            self._items_by_id[queue_item.id] = queue_item
+            self._after_write()
+            logger.debug(f"Added {file_name} to queue with tags: {tags}")
+            return queue_item.id
     
+    def add_many_to_queue(self, files: List[Tuple[str, str, List[str], Optional[str]]]) -> List[str]:
+        """Add several files at once, given as (file_path, file_name, tags, file_hash),
+        with a single database transaction. Returns the new ids, empty on failure."""
+        with self._lock:
+            self._refresh_if_stale()
+            added_at = datetime.now().isoformat()
+            items = [
+                models.QueueItem(
+                    id=str(uuid.uuid4()),
+                    file_path=file_path,
+                    file_name=file_name,
+                    added_at=added_at,
+                    tags=tags or [],
+                    file_hash=file_hash
+                )
+                for file_path, file_name, tags, file_hash in files
+            ]
+
+            if not self.db.insert_queue_items(items):
+                logger.error(f"Failed to add {len(items)} files to queue in database")
+                self._after_write()
+                return []
+            self._queue.extend(items)
+            self._items_by_id.update((item.id, item) for item in items)
+            self._after_write()
+            logger.debug(f"Added {len(items)} files to queue")
+            return [item.id for item in items]
+
+    def remove_many_from_queue(self, item_ids: List[str]) -> List[str]:
+        """Remove several items at once, returns the ids that were in the queue"""
+        with self._lock:
+            self._refresh_if_stale()
+            removed = [item_id for item_id in dict.fromkeys(item_ids) if item_id in self._items_by_id]
+            if not removed:
+                return []
+
+            self.db.delete_queue_items(removed)
+            for item_id in removed:
+                self._items_by_id.pop(item_id)
+            self._queue = [item for item in self._queue if item.id in self._items_by_id]
+            self._after_write()
+            logger.debug(f"Removed {len(removed)} items from queue")
+            return removed
+
+    def update_many_status(self, item_ids: List[str], status: str,
+                           error_message: str = None) -> List[str]:
+        """Set the same status on several items at once, with the same fields as
+        retry_queue_item, mark_print_failed and mark_print_successful.
+        Returns the ids that were in the queue."""
+        with self._lock:
+            self._refresh_if_stale()
+            items = [self._items_by_id[item_id] for item_id in dict.fromkeys(item_ids) if item_id in self._items_by_id]
+            if not items:
+                return []
+
+            finished_at = None if status == "todo" else datetime.now().isoformat()
+            error_message = error_message if status == "failed" else None
+            # back to todo forgets the last attempt, other statuses keep its printer for the history
+            keep_assignment = status != "todo"
+            success = self.db.update_queue_items_status(
+                [item.id for item in items], status, finished_at=finished_at, error_message=error_message,
+                keep_assignment=keep_assignment
+            )
+            if success:
+                for item in items:
+                    item.status = status
+                    if not keep_assignment:
+                        item.printer_name = None
+                        item.started_at = None
+                    item.finished_at = finished_at
+                    item.error_message = error_message
+            self._after_write()
+            return [item.id for item in items] if success else []
+
     def remove_from_queue(self, queue_item_id: str) -> bool:
         """Remove an item from the queue"""
-        original_length = len(self._queue)
-        self._queue = [
-            item for item in self._queue 
-            if item.id != queue_item_id
-        ]
+        with self._lock:
+            self._refresh_if_stale()
+            item = self._items_by_id.pop(queue_item_id, None)
         
-        success = len(self._queue) < original_length
-        if success:
-            self._save_queue()
-            logger.debug(f"Removed queue item {queue_item_id} from queue")
-        return success
+            success = item is not None
+            if success:
+                del self._queue[self._position(item)]
+                self.db.delete_queue_item(queue_item_id)
+                self._after_write()
+                logger.debug(f"Removed queue item {queue_item_id} from queue")
+            return success
     
     def get_queue(self, tag_filter: List[str] = None) -> List[models.QueueItem]:
         """Get the queue, optionally filtered by tags"""
-        # Reload from database to ensure we have the latest state
-        self._load_queue()
-        
-        if not tag_filter:
-            return self._queue.copy()
+        return self.get_queue_page(tag_filter)[0]
+
+    @staticmethod
+    def _encode_cursor(key: Tuple[int, str]) -> str:
+        """Opaque page cursor holding the (order_index, id) key of an item"""
+        return base64.urlsafe_b64encode(json.dumps(list(key)).encode()).decode().rstrip("=")
+
+    @staticmethod
+    def _decode_cursor(cursor: str) -> Tuple[int, str]:
+        """Key of a page cursor, ValueError if it isn't one"""
+        try:
+            order_index, item_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        except Exception:
+            raise ValueError(f"Invalid queue cursor: {cursor}")
+        if not isinstance(order_index, int) or not isinstance(item_id, str):
+            raise ValueError(f"Invalid queue cursor: {cursor}")
+        return order_index, item_id
+
+    def get_queue_page(self, tag_filter: List[str] = None, statuses: List[str] = None,
+                       printer_name: str = None, after: str = None,
+                       limit: int = None) -> Tuple[List[models.QueueItem], int, Optional[str]]:
+        """Get a window of the queue matching the filters, the total number of matching
+        items and the cursor of the next page, None on the last one. `after` is the
+        cursor returned with the previous page, a ValueError if it can't be read."""
+        after_key = self._decode_cursor(after) if after is not None else None
+        with self._lock:
+            self._refresh_if_stale()
         
-        # Filter by tags - item must have at least one of the specified tags
-        filtered_queue = []
-        for item in self._queue:
-            if any(tag in item.tags for tag in tag_filter):
-                filtered_queue.append(item)
+            if not (tag_filter or statuses or printer_name is not None or after is not None or limit is not None):
+                return self._queue.copy(), len(self._queue), None
         
-        return filtered_queue
+            # Filters and pagination run as indexed queries, items are then served from memory
+            item_ids, total, last_key = self.db.get_queue_page(
+                tags=tag_filter, statuses=statuses, printer_name=printer_name, after=after_key, limit=limit
+            )
+            items = [self._items_by_id[item_id] for item_id in item_ids if item_id in self._items_by_id]
+            next_cursor = self._encode_cursor(last_key) if limit is not None and len(item_ids) == limit else None
+            return items, total, next_cursor
     
     def clear_queue(self, tag_filter: List[str] = None) -> bool:
         """Clear all items from the queue, optionally filtered by tags"""
-        if not tag_filter:
-            # Clear entire queue
-            self._queue = []
-            self._save_queue()
-            logger.debug("Cleared entire queue")
-            return True
-        else:
-            # Clear only items matching tags
-            original_length = len(self._queue)
-            self._queue = [
-                item for item in self._queue
-                if not any(tag in item.tags for tag in tag_filter)
-            ]
-            removed_count = original_length - len(self._queue)
-            if removed_count > 0:
-                self._save_queue()
-            logger.debug(f"Cleared {removed_count} items with tags {tag_filter} from queue")
-            return removed_count > 0
+        with self._lock:
+            self._refresh_if_stale()
+            if not tag_filter:
+                # Clear entire queue
+                self._queue = []
+                self._items_by_id = {}
+                self.db.clear_queue()
+                self._after_write()
+                logger.debug("Cleared entire queue")
+                return True
+            else:
+                # Clear only items matching tags
+                removed_ids = self.db.delete_queue_items_by_tags(tag_filter)
+                self._after_write()
+                removed_count = len(removed_ids)
+                if removed_count > 0:
+                    for item_id in removed_ids:
+                        self._items_by_id.pop(item_id, None)
+                    self._queue = [item for item in self._queue if item.id in self._items_by_id]
+                logger.debug(f"Cleared {removed_count} items with tags {tag_filter} from queue")
+                return removed_count > 0
     
     def reorder_queue(self, item_ids: List[str]) -> bool:
         """Reorder items in the queue"""
-        id_to_item = {item.id: item for item in self._queue}
+        with self._lock:
+            self._refresh_if_stale()
+            id_to_item = self._items_by_id
         
-        # Verify all IDs exist
-        if not all(item_id in id_to_item for item_id in item_ids):
-            return False
+            # Verify all IDs exist
+            if not all(item_id in id_to_item for item_id in item_ids):
+                return False
         
-        # Keep items not in reorder list at the end
-        items_not_in_reorder = [item for item in self._queue if item.id not in item_ids]
+            # Keep items not in reorder list at the end
+            reorder_ids = set(item_ids)
+            items_not_in_reorder = [item for item in self._queue if item.id not in reorder_ids]
         
-        # Reorder specified items
-        reordered_items = [id_to_item[item_id] for item_id in item_ids]
+            # Reorder specified items
+            reordered_items = [id_to_item[item_id] for item_id in item_ids]
         
-        # Combine reordered items with remaining items
-        self._queue = reordered_items + items_not_in_reorder
-        self._save_queue()
-        logger.info("Reordered queue")
-        return True
+            # Combine reordered items with remaining items
+            self._queue = reordered_items + items_not_in_reorder
+            # only rows whose position actually changed get written
+            self.db.update_queue_order([
+                (item.id, (i + 1) * ORDER_GAP) for i, item in enumerate(self._queue)
+            ])
+            self._after_write()
+            logger.info("Reordered queue")
+            return True
+
+    def move_queue_item(self, item_id: str, before_id: str = None, after_id: str = None) -> bool:
+        """Move an item right before or after another item of the queue"""
+        with self._lock:
+            if (before_id is None) == (after_id is None):
+                return False
+
+            anchor_id = before_id if before_id is not None else after_id
+            self._refresh_if_stale()
+            if item_id not in self._items_by_id or anchor_id not in self._items_by_id:
+                return False
+            if item_id == anchor_id:
+                return True
+
+            if not self.db.move_queue_item(item_id, before_id=before_id, after_id=after_id):
+                logger.error(f"Failed to move queue item {item_id} in database")
+                return False
+
+            item = self._items_by_id[item_id]
+            del self._queue[self._position(item)]
+            anchor_position = self._position(self._items_by_id[anchor_id])
+            self._queue.insert(anchor_position if before_id is not None else anchor_position + 1, item)
+            self._after_write()
+            logger.debug(f"Moved queue item {item_id} {'before' if before_id is not None else 'after'} {anchor_id}")
+            return True
     
     def get_all_tags(self) -> List[str]:
         """Get all unique tags used in the queue"""
-        all_tags = set()
-        for item in self._queue:
-            all_tags.update(item.tags)
-        return sorted(list(all_tags))
+        return self.db.get_all_tags()
 
     def update_queue_item_status(self, item_id: str, status: str, printer_name: str = None,
                                 started_at: str = None, finished_at: str = None,
                                 error_message: str = None) -> bool:
         """Update the status of a queue item"""
-        # Update in memory
-        for item in self._queue:
-            if item.id == item_id:
-                item.status = status
-                if printer_name is not None:
-                    item.printer_name = printer_name
-                if started_at is not None:
-                    item.started_at = started_at
-                if finished_at is not None:
-                    item.finished_at = finished_at
-                if error_message is not None:
-                    item.error_message = error_message
-                break
-        else:
-            logger.warning(f"Queue item {item_id} not found for status update")
-            return False
+        with self._lock:
+            self._refresh_if_stale()
+
+            # Update in memory
+            item = self._items_by_id.get(item_id)
+            if item is None:
+                logger.warning(f"Queue item {item_id} not found for status update")
+                return False
+
+            # mirror exactly what the database stores, so the cached item
+            # doesn't diverge from what other processes reload
+            item.status = status
+            item.printer_name = printer_name
+            item.started_at = started_at
+            item.finished_at = finished_at
+            item.error_message = error_message
         
-        # Update in database
-        success = self.db.update_queue_item_status(item_id, status, printer_name, 
-                                                  started_at, finished_at, error_message)
-        if not success:
-            logger.error(f"Failed to update queue item {item_id} in database")
+            # Update in database
+            success = self.db.update_queue_item_status(item_id, status, printer_name, 
+                                                      started_at, finished_at, error_message)
+            self._after_write()
+            if not success:
+                logger.error(f"Failed to update queue item {item_id} in database")
         
-        return success
+            return success
 
     def get_queue_item_by_id(self, item_id: str) -> Optional[models.QueueItem]:
         """Get a specific queue item by ID"""
-        self._load_queue()
+        with self._lock:
+            self._refresh_if_stale()
+            return self._items_by_id.get(item_id)
 
-        for item in self._queue:
-            if item.id == item_id:
-                return item
-        return None
+    def archive_completed_items(self) -> int:
+        """Move items completed for longer than QUEUE_ARCHIVE_DELAY to the history,
+        then apply the history retention policy. Returns the number of archived items."""
+        with self._lock:
+            self._refresh_if_stale()
+            cutoff = datetime.now() - timedelta(seconds=utils.QUEUE_ARCHIVE_DELAY)
+            archived_ids = self.db.archive_queue_items(self.ARCHIVE_STATUSES, cutoff.isoformat())
+            if archived_ids:
+                self._after_write()
+                for item_id in archived_ids:
+                    self._items_by_id.pop(item_id, None)
+                self._queue = [item for item in self._queue if item.id in self._items_by_id]
+                logger.info(f"Archived {len(archived_ids)} completed queue items")
+
+            if utils.HISTORY_RETENTION_DAYS > 0:
+                retention_cutoff = datetime.now() - timedelta(days=utils.HISTORY_RETENTION_DAYS)
+                purged = self.db.purge_history(retention_cutoff.isoformat())
+                if purged:
+                    logger.info(f"Purged {purged} history entries older than {utils.HISTORY_RETENTION_DAYS} days")
+                    if utils.HISTORY_COMPACT:
+                        self.db.compact()
+
+            return len(archived_ids)
+
+    def get_history(self, statuses: List[str] = None, printer_name: str = None,
+                    before: int = None, limit: int = 100) -> List[models.HistoryItem]:
+        """Get archived items, most recently archived first"""
+        return self.db.load_history(statuses=statuses, printer_name=printer_name, before=before, limit=limit)
 
     def mark_print_started(self, item_id: str, printer_name: str) -> bool:
         """Mark a queue item as started printing"""
@@ -345,30 +877,30 @@ class PrintQueueManager:
             started_at=datetime.now().isoformat()
         )
 
+    def _complete_item(self, item_id: str, status: str, error_message: str = None) -> bool:
+        """Set a final status, keeping the printer and start date of the print for the history"""
+        with self._lock:
+            item = self.get_queue_item_by_id(item_id)
+            return self.update_queue_item_status(
+                item_id,
+                status=status,
+                printer_name=item.printer_name if item else None,
+                started_at=item.started_at if item else None,
+                finished_at=datetime.now().isoformat(),
+                error_message=error_message
+            )
+
     def mark_print_finished(self, item_id: str) -> bool:
         """Mark a queue item as finished printing"""
-        return self.update_queue_item_status(
-            item_id,
-            status="finished",
-            finished_at=datetime.now().isoformat()
-        )
+        return self._complete_item(item_id, "finished")
 
     def mark_print_failed(self, item_id: str, error_message: str = None) -> bool:
         """Mark a queue item as failed"""
-        return self.update_queue_item_status(
-            item_id,
-            status="failed",
-            finished_at=datetime.now().isoformat(),
-            error_message=error_message
-        )
+        return self._complete_item(item_id, "failed", error_message)
     
     def mark_print_successful(self, item_id: str) -> bool:
         """Mark a queue item as successful and remove it from the queue"""
-        return self.update_queue_item_status(
-            item_id,
-            status="success",
-            finished_at=datetime.now().isoformat()
-        )
+        return self._complete_item(item_id, "success")
 
     def retry_queue_item(self, item_id: str) -> bool:
         """Reset a finished or failed queue item back to todo status"""
@@ -383,6 +915,6 @@ class PrintQueueManager:
 
 
 # Global instances
-file_manager = FileManager()
 default_db_path = os.environ.get("DATABASE_PATH", "/data/makerprint.db")
+file_manager = FileManager(db_path=default_db_path)
 queue_manager = PrintQueueManager(default_db_path)
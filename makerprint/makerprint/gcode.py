@@ -0,0 +1,278 @@
+"""
+Lazy, memory-mapped G-code source for printcore
+"""
+import math
+import mmap
+import os
+import re
+import threading
+from array import array
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+
+from printrun import gcoder
+
+CHECKPOINT_INTERVAL = 4096  # lines between two remembered byte offsets
+TIME_TABLE_STEP = 16  # lines between two entries of the cumulative time table
+DEFAULT_ACCELERATION = 2000.0  # mm/s^2, same value as printrun's estimate
+ETA_MIN_OBSERVED = 60.0  # estimated seconds printed before the observed speed is used at all
+ETA_TRUST_TIME = 600.0  # estimated seconds printed after which the observed speed weighs half
+ETA_MAX_RATIO = 4.0  # bound on how much faster or slower than estimated a print can be assumed
+
+_PARAM_RE = re.compile(rb"([A-Z])\s*([-+]?\d*\.?\d+)")
+
+
+class _Layer:
+    """Single pseudo-layer giving printcore indexed access to every line"""
+
+    def __init__(self, gcode: "StreamingGCode"):
+        self._gcode = gcode
+
+    def __getitem__(self, index: int):
+        return self._gcode[index]
+
+
+class StreamingGCode:
+    """Read-only G-code file exposing the part of printrun's GCode interface
+    printcore uses while printing (has_index, idxs, all_layers, append).
+
+    Lines are read lazily from a memory map instead of being loaded in a list.
+    Only the byte offset of one line every CHECKPOINT_INTERVAL lines is kept,
+    plus a cursor on the last line read, so sequential access is O(1) and
+    memory stays bounded whatever the file size. Blank lines are skipped."""
+
+    def __init__(self, filepath: str):
+        self.filepath = filepath
+        self._file = open(filepath, "rb")
+        self.size = os.fstat(self._file.fileno()).st_size
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if self.size else None
+
+        self._checkpoints = array("Q")  # byte offset of lines 0, CHECKPOINT_INTERVAL, ...
+        self._cursor: Optional[Tuple[int, int]] = None  # (index, offset) of the last line read
+        self._line_count: Optional[int] = 0 if self._mm is None else None  # known once EOF was reached
+        self._appended: List[str] = []  # commands queued with printcore.send() while printing
+        self._lock = threading.Lock()  # the print thread and status requests read concurrently
+
+        self.all_layers = [_Layer(self)]
+        self.lines = self  # printcore only checks it for emptiness
+
+    def _next_line(self, offset: int) -> Optional[Tuple[str, int, int]]:
+        """Find the first non blank line at or after offset: (line, start, next offset)"""
+        while offset < self.size:
+            end = self._mm.find(b"\n", offset)
+            if end == -1:
+                end = self.size
+            line = self._mm[offset:end].strip()
+            if line:
+                return line.decode("utf-8", errors="replace"), offset, end + 1
+            offset = end + 1
+        return None
+
+    def _locate(self, index: int) -> Optional[Tuple[str, int]]:
+        """Get a line of the file and its byte offset, None past the last line"""
+        with self._lock:
+            if index < 0 or (self._line_count is not None and index >= self._line_count):
+                return None
+
+            # start from the cursor when it's just behind the wanted line,
+            # otherwise from the closest checkpoint already discovered
+            if self._cursor and self._cursor[0] <= index < self._cursor[0] + CHECKPOINT_INTERVAL:
+                current, offset = self._cursor
+            elif self._checkpoints:
+                checkpoint = min(index // CHECKPOINT_INTERVAL, len(self._checkpoints) - 1)
+                current, offset = checkpoint * CHECKPOINT_INTERVAL, self._checkpoints[checkpoint]
+            else:
+                current, offset = 0, 0
+
+            while True:
+                found = self._next_line(offset)
+                if found is None:
+                    self._line_count = current
+                    return None
+
+                line, start, offset = found
+                if current % CHECKPOINT_INTERVAL == 0 and current // CHECKPOINT_INTERVAL == len(self._checkpoints):
+                    self._checkpoints.append(start)
+                if current == index:
+                    # only move forward so peeks at earlier lines don't slow the print thread down
+                    if self._cursor is None or index > self._cursor[0]:
+                        self._cursor = (index, start)
+                    return line, start
+                current += 1
+
+    def __getitem__(self, index: int):
+        found = self._locate(index)
+        if found is not None:
+            return gcoder.LightLine(found[0])
+        return gcoder.LightLine(self._appended[index - self._line_count])
+
+    def has_index(self, index: int) -> bool:
+        if self._locate(index) is not None:
+            return True
+        return 0 <= index - self._line_count < len(self._appended)
+
+    def idxs(self, index: int) -> Tuple[int, int]:
+        return 0, index
+
+    def append(self, command: str, store: bool = True):
+        self._appended.append(command)
+
+    def __bool__(self) -> bool:
+        return self.has_index(0)
+
+    def __len__(self) -> int:
+        """Number of lines, reads the whole file the first time"""
+        self._locate(2 ** 63 - 1)
+        return self._line_count + len(self._appended)
+
+    def fraction_done(self, index: int) -> float:
+        """Fraction of the file before the given line, from its byte offset"""
+        found = self._locate(index)
+        if found is None:
+            return 1.0
+        return found[1] / self.size
+
+    def close(self):
+        if self._mm is not None:
+            self._mm.close()
+        self._file.close()
+
+
+@dataclass
+class GCodeAnalysis:
+    """Summary of a G-code file, computed once and cached by path, mtime and size"""
+    file_path: str
+    mtime: float
+    size: int
+    line_count: int = 0  # non blank lines, same indexing as StreamingGCode
+    estimated_time: float = 0.0  # seconds
+    filament_used: float = 0.0  # mm of filament
+    layers: array = field(default_factory=lambda: array("Q"))  # first extruding line of each layer
+    time_table: array = field(default_factory=lambda: array("d"))  # seconds before line i * TIME_TABLE_STEP
+
+    def time_before(self, index: int) -> float:
+        """Estimated seconds spent printing the lines before index, interpolated
+        between the two surrounding entries of the time table"""
+        if index >= self.line_count:
+            return self.estimated_time
+        slot, offset = divmod(index, TIME_TABLE_STEP)
+        start = self.time_table[slot]
+        if not offset:
+            return start
+        end = self.time_table[slot + 1] if slot + 1 < len(self.time_table) else self.estimated_time
+        span = min(TIME_TABLE_STEP, self.line_count - slot * TIME_TABLE_STEP)
+        return start + (end - start) * offset / span
+
+    def time_remaining(self, index: int, elapsed: float) -> float:
+        """Remaining seconds from line index, the static estimate corrected by
+        how fast the print actually went so far.
+
+        The observed ratio weighs more as printing time accumulates, so heating
+        or a slow first layer barely move the early estimate while a printer
+        that is consistently slower than the model converges to its real pace."""
+        done = self.time_before(index)
+        remaining = self.estimated_time - done
+        if done < ETA_MIN_OBSERVED or elapsed <= 0:
+            return remaining
+
+        ratio = min(max(elapsed / done, 1 / ETA_MAX_RATIO), ETA_MAX_RATIO)
+        weight = done / (done + ETA_TRUST_TIME)
+        return remaining * (1 + weight * (ratio - 1))
+
+
+def analyze_gcode(filepath: str, file_path: Optional[str] = None) -> GCodeAnalysis:
+    """Read a G-code file once and estimate its print time, filament use and layers.
+
+    Move durations follow the acceleration model of printrun's gcoder, but the
+    file is streamed line by line instead of being parsed into a GCode object."""
+    stat = os.stat(filepath)
+    analysis = GCodeAnalysis(file_path=file_path or filepath, mtime=stat.st_mtime, size=stat.st_size)
+    time_table = analysis.time_table
+    layers = analysis.layers
+
+    x = y = z = e = 0.0
+    feedrate = last_feedrate = 0.0  # mm/s
+    last_dx = last_dy = 0.0
+    relative = relative_e = False
+    layer_z = None
+    total_time = filament = 0.0
+    index = 0
+
+    with open(filepath, "rb") as f:
+        for raw in f:
+            line = raw.strip()
+            if not line:
+                continue
+            if index % TIME_TABLE_STEP == 0:
+                time_table.append(total_time)
+            index += 1
+
+            code = line.split(b";", 1)[0].upper()
+            if not code:
+                continue
+            command, _, rest = code.partition(b" ")
+            params = dict(_PARAM_RE.findall(rest))
+
+            if command in (b"G0", b"G1", b"G00", b"G01"):
+                new_x = float(params[b"X"]) + (x if relative else 0) if b"X" in params else x
+                new_y = float(params[b"Y"]) + (y if relative else 0) if b"Y" in params else y
+                new_z = float(params[b"Z"]) + (z if relative else 0) if b"Z" in params else z
+                extruded = 0.0
+                if b"E" in params:
+                    value = float(params[b"E"])
+                    extruded = value if relative_e else value - e
+                    e = e + value if relative_e else value
+                if b"F" in params:
+                    feedrate = float(params[b"F"]) / 60.0
+
+                dx, dy = new_x - x, new_y - y
+                if dx * last_dx + dy * last_dy <= 0:
+                    last_feedrate = 0.0  # direction change, the printer has to accelerate again
+                travel = math.hypot(dx, dy) or abs(new_z - z) or abs(extruded)
+
+                if feedrate == last_feedrate:
+                    duration = travel / feedrate if feedrate else 0.0
+                else:
+                    distance = abs((last_feedrate + feedrate) * (feedrate - last_feedrate) / DEFAULT_ACCELERATION)
+                    if distance <= travel and feedrate:
+                        duration = 2 * distance / (last_feedrate + feedrate) + (travel - distance) / feedrate
+                    else:
+                        duration = 2 * travel / (last_feedrate + feedrate)
+
+                if extruded > 0:
+                    filament += extruded
+                    if (dx or dy) and (layer_z is None or new_z > layer_z):
+                        layer_z = new_z
+                        layers.append(index - 1)
+
+                total_time += duration
+                x, y, z = new_x, new_y, new_z
+                last_dx, last_dy, last_feedrate = dx, dy, feedrate
+            elif command == b"G4":
+                if b"P" in params:
+                    total_time += float(params[b"P"]) / 1000.0
+                elif b"S" in params:
+                    total_time += float(params[b"S"])
+            elif command == b"G28":
+                homed = [axis for axis in (b"X", b"Y", b"Z") if axis in rest] or [b"X", b"Y", b"Z"]
+                x = 0.0 if b"X" in homed else x
+                y = 0.0 if b"Y" in homed else y
+                z = 0.0 if b"Z" in homed else z
+            elif command == b"G92":
+                x = float(params.get(b"X", x))
+                y = float(params.get(b"Y", y))
+                z = float(params.get(b"Z", z))
+                e = float(params.get(b"E", e))
+            elif command == b"G90":
+                relative = relative_e = False
+            elif command == b"G91":
+                relative = relative_e = True
+            elif command == b"M82":
+                relative_e = False
+            elif command == b"M83":
+                relative_e = True
+
+    analysis.line_count = index
+    analysis.estimated_time = total_time
+    analysis.filament_used = filament
+    return analysis
@@ -17,6 +17,7 @@ if MOCK:
     utils.logger.info("mock mode enabled, creating mock printers")
     for i in range(3):
         utils.create_mock_printer(i)
+    printer_config.refresh_devices()  # the port listing was cached before the mock ports existed
 
     utils.logger.info(f"Available printers: {printer_config.get_available_printers()}")
 
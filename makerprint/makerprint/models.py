@@ -29,6 +29,12 @@ class PrinterStatus(pydantic.BaseModel):
     bedTemp: Optional[BedTemp] = BedTemp(current=0, target=0)
     nozzleTemp: Optional[NozzleTemp] = NozzleTemp(current=0, target=0)
 
+class PrinterActionResult(pydantic.BaseModel):
+    """Outcome of a fleet-wide action for one printer"""
+    success: bool
+    error: Optional[str] = None
+    status: Optional[PrinterStatus] = None
+
 class File(pydantic.BaseModel):
     name: str
     path: str  # Full path from root
@@ -47,6 +53,11 @@ class FileNode(pydantic.BaseModel):
     children: Optional[list['FileNode']] = None  # Only for folders
     tags: list[str] = []
 
+class QueueBatchEntry(pydantic.BaseModel):
+    """A file to add to the queue in a batch"""
+    file_path: str
+    tags: list[str] = []
+
 class QueueItem(pydantic.BaseModel):
     """Represents an item in the print queue"""
     id: str  # Unique identifier for this queue item
@@ -59,11 +70,17 @@ class QueueItem(pydantic.BaseModel):
     started_at: Optional[str] = None  # When printing started
     finished_at: Optional[str] = None  # When printing finished
     error_message: Optional[str] = None  # Error message if failed
+    file_hash: Optional[str] = None  # Content hash of the file, follows it across renames
 
     def __init__(self, **data):
         super().__init__(**data)
         if not self.tags:
             self.tags.append("any")
 
+class HistoryItem(QueueItem):
+    """Represents a completed queue item moved to the print history"""
+    archived_at: str  # ISO datetime string
+    history_id: Optional[int] = None  # cursor for paginating the history
+
 # Update forward references
 FileNode.model_rebuild() 
@@ -2,18 +2,20 @@ import os
 import threading
 import time
 import asyncio
-from datetime import datetime
 
 from printrun.printcore import printcore, Callback
-from printrun import gcoder
-from fastapi import HTTPException
 
 from . import utils, models
 from .utils import logger
-from .file_manager import queue_manager
+from .gcode import StreamingGCode
+from .file_manager import file_manager, queue_manager
+
+class PrinterError(Exception):
+    """Raised by printer operations, reported to the api by the worker"""
+
 
 class Printer(printcore):
-    def __init__(self, port, baud=None, printer_name=None, display_name=None, temp_update_callback=None, *args, **kwargs):
+    def __init__(self, port, baud=None, printer_name=None, display_name=None, temp_update_callback=None, baud_candidates=None, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.callback.temp = self._tempcb
         self.callback.start = self._startcb
@@ -23,6 +25,7 @@ class Printer(printcore):
         self.loud = os.getenv("LOUD", "false").lower() in ("1", "true", "yes")
         self.port = port
         self.baud = baud
+        self.baud_candidates = baud_candidates  # baudrates tried in this order when baud is unknown
         self.extruder_temp = 0 
         self.extruder_temp_target = 0 
         self.bed_temp = 0 
@@ -33,6 +36,7 @@ class Printer(printcore):
         self.temp_update_callback = temp_update_callback
         self.current_queue_item_id = None  # ID of the queue item being printed
         self.current_queue_item_name = None  # Name of the queue item being printed
+        self.analysis = None  # cached analysis of the file being printed, used for the ETA
         self.start_time = time.time() # meh just want to have a default value
         self.total_paused_duration = 0
         self.pause_start_time = None
@@ -51,34 +55,39 @@ class Printer(printcore):
         
         queue_item = qm.get_queue_item_by_id(queue_item_id)
         if not queue_item:
-            raise HTTPException(
-                status_code=404,
-                detail=f"Queue item {queue_item_id} not found",
-            )
+            raise PrinterError(f"Queue item {queue_item_id} not found")
         
         if queue_item.status != "todo":
-            raise HTTPException(
-                status_code=400,
-                detail=f"Queue item {queue_item_id} is not in 'todo' status (current: {queue_item.status})",
-            )
+            raise PrinterError(f"Queue item {queue_item_id} is not in 'todo' status (current: {queue_item.status})")
 
         folder = utils.GCODEFOLDER
-        filepath = os.path.join(folder, queue_item.file_path)
+        file_path = queue_item.file_path
+        if not os.path.exists(os.path.join(folder, file_path)) and queue_item.file_hash:
+            # renamed or moved since it was queued, follow its content
+            file_path = file_manager.find_file_by_hash(queue_item.file_hash) or file_path
+        filepath = os.path.join(folder, file_path)
         if not os.path.exists(filepath):
-            raise HTTPException(
-                status_code=404,
-                detail=f"File {queue_item.file_path} not found in {folder}",
-            )
+            raise PrinterError(f"File {queue_item.file_path} not found in {folder}")
 
         self.current_queue_item_id = queue_item_id
         self.current_queue_item_name = queue_item.file_name
         
         # Mark the item as being printed
         qm.mark_print_started(queue_item_id, self.name)
+
+        self.analysis = file_manager.get_analysis(file_path)
+        if self.analysis is None:
+            # file added without going through an upload, or changed since: analyse it
+            # in the background and fall back to the byte progress until it's done
+            file_manager.schedule_analysis(file_path).add_done_callback(
+                lambda future: self._set_analysis(queue_item_id, future.result())
+            )
         
-        gcode = [i.strip() for i in open(filepath).readlines() if i.strip()]
-        gcode = gcoder.LightGCode(gcode)
-        return gcode
+        return StreamingGCode(filepath)
+
+    def _set_analysis(self, queue_item_id, analysis):
+        if self.current_queue_item_id == queue_item_id:
+            self.analysis = analysis
 
     def _startcb(self, resuming=False):
         if not resuming:
@@ -94,11 +103,9 @@ class Printer(printcore):
 
     def _endcb(self):
         if not self.paused:
-            queue_manager.update_queue_item_status(
-                self.current_queue_item_id, 
-                status="finished",
-                finished_at=datetime.now().isoformat()
-            )
+            if self.current_queue_item_id:
+                # keeps the printer and start date of the print for the history
+                queue_manager.mark_print_finished(self.current_queue_item_id)
             
             if self.start_time is not None:
                 elapsed = self._get_actual_elapsed_time()
@@ -115,6 +122,7 @@ class Printer(printcore):
         self.start_time = None
         self.current_queue_item_id = None
         self.current_queue_item_name = None
+        self.analysis = None
         self.total_paused_duration = 0
         self.pause_start_time = None
 
@@ -168,13 +176,21 @@ class Printer(printcore):
         elapsed_time = None
         
         if self.mainqueue:
-            fraction = self.queueindex / len(self.mainqueue)
+            analysis = self.analysis
+            if analysis and analysis.estimated_time > 0:
+                time_done = analysis.time_before(self.queueindex)
+                fraction = time_done / analysis.estimated_time
+            else:
+                fraction = self.mainqueue.fraction_done(self.queueindex)
             percentage = round(fraction * 100, 1)
 
             if self.start_time:
                 elapsed_time = self._get_actual_elapsed_time()
-                total_time = elapsed_time / max(fraction, 0.01)
-                time_remaining = (total_time - elapsed_time)
+                if analysis and analysis.estimated_time > 0:
+                    time_remaining = analysis.time_remaining(self.queueindex, elapsed_time)
+                else:
+                    total_time = elapsed_time / max(fraction, 0.01)
+                    time_remaining = (total_time - elapsed_time)
 
         status = 'printing' if self.printing else 'paused' if self.paused else 'idle'
 
@@ -204,10 +220,7 @@ class Printer(printcore):
     def clear_bed(self):
         """Set the bed to clear. This is used to indicate that the bed is clear for a new print."""
         if not self.online:
-            raise HTTPException(
-                status_code=400,
-                detail=f"Printer {self.name} is not connected",
-            )
+            raise PrinterError(f"Printer {self.name} is not connected")
         self.bed_clear = True
         logger.info(f"Bed cleared for printer {self.name} on {self.port}")
 
@@ -239,12 +252,9 @@ class Printer(printcore):
         self.baud = baud or self.baud
 
         if not self.baud:
-            detected = await utils.auto_detect_baud(port=self.port)
+            detected = await utils.auto_detect_baud(port=self.port, baudrates=self.baud_candidates)
             if not detected:
-                raise HTTPException(
-                    status_code=400,
-                    detail=f"Failed to auto-detect baud rate for {self.port}",
-                )
+                raise PrinterError(f"Failed to auto-detect baud rate for {self.port}")
 
             self.baud = detected
 
@@ -255,9 +265,6 @@ class Printer(printcore):
             await asyncio.sleep(0.1)
 
         if not self.online:
-            raise HTTPException(
-                status_code=400,
-                detail=f"Failed to connect to printer on {self.port} at {self.baud} baud",
-            )
+            raise PrinterError(f"Failed to connect to printer on {self.port} at {self.baud} baud")
 
         logger.debug(f"Connected to printer {self.name} on {self.port} at {self.baud} baud")
\ No newline at end of file
@@ -3,16 +3,54 @@ Printer Process Manager - Manages multiple printer worker processes
 """
 import asyncio
 import atexit
+import itertools
 import multiprocessing
 import os
 import threading
 import time
+import uuid
+import zlib
 from queue import Empty, Queue
-from typing import Any, Dict, Optional
+from typing import Any, Dict, Optional, Set
 
 from . import models, utils
 from .config import printer_config
-from .printer_worker import WorkerCommand, WorkerResponse, start_printer_worker
+from .file_manager import queue_manager
+from .printer_worker import WorkerCommand, WorkerResponse, run_pooled_worker, start_printer_worker
+from .worker_backends import WORKER_BACKENDS, start_worker_in_api
+
+CONNECT_TIMEOUT = 15.0  # seconds for a worker to open the port and see the printer online
+WORKER_BACKEND = os.environ.get("WORKER_BACKEND", "process")  # process, thread or task, printers can override it with worker_backend
+WORKER_POOL_SIZE = int(os.environ.get("WORKER_POOL_SIZE", 2))  # idle worker processes kept ready for the next printer, 0 disables the pool
+WORKER_START_METHOD = os.environ.get("WORKER_START_METHOD") or None  # fork, forkserver or spawn, platform default when unset
+HEARTBEAT_TIMEOUT = float(os.environ.get("HEARTBEAT_TIMEOUT", 30))  # seconds without heartbeat before a worker is considered hung
+SUPERVISOR_INTERVAL = 1.0  # seconds between two health checks of the workers
+RESTART_BACKOFF_BASE = 1.0  # seconds before restarting a crashed worker, doubled on every crash in a row
+RESTART_BACKOFF_MAX = 60.0  # longest wait before a restart
+RESTART_STABLE_AFTER = 120.0  # seconds a worker has to stay healthy for its backoff to reset
+FLEET_CONCURRENCY = int(os.environ.get("FLEET_CONCURRENCY", 10))  # printers handled at once by connect_all / disconnect_all
+
+
+class StatusSubscription:
+    """Pending printer status changes for one consumer living on its own event loop.
+    Changes are coalesced per printer, so a slow consumer only ever gets the latest status."""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self._event = asyncio.Event()
+
+    def push(self, printer_name: str, status: Dict[str, Any]):
+        """Queue a change, must be called from the subscription's loop"""
+        self._pending[printer_name] = status
+        self._event.set()
+
+    async def get(self) -> Dict[str, Dict[str, Any]]:
+        """Wait for changes and return them (printer name -> status)"""
+        await self._event.wait()
+        self._event.clear()
+        changes, self._pending = self._pending, {}
+        return changes
 
 
 class PrinterManager:
@@ -21,7 +59,21 @@ class PrinterManager:
     def __init__(self):
         self.workers: Dict[str, Dict[str, Any]] = {}
         self.printer_statuses: Dict[str, Dict[str, Any]] = {}
-        self.status_queue = multiprocessing.Queue()
+        self.mp_context = multiprocessing.get_context(WORKER_START_METHOD)
+        if self.mp_context.get_start_method() == "forkserver":
+            # workers are forked from a server that already imported the worker modules
+            self.mp_context.set_forkserver_preload(["makerprint.printer_worker"])
+        self.status_queue = self.mp_context.Queue()
+        self._spare_workers: list[Dict[str, Any]] = []  # started processes waiting for a printer
+        self._spare_starting = 0  # spare processes being started
+        self._pool_lock = threading.Lock()
+        self._status_subscriptions: Set[StatusSubscription] = set()
+        self._status_seqs: Dict[str, int] = {}  # last status update sequence applied per printer
+        self._status_revision = 0  # bumped on every change of printer_statuses
+        self._restart_attempts: Dict[str, int] = {}  # crashes in a row per printer, for the backoff
+        self._worker_locks: Dict[str, threading.RLock] = {}  # serializes worker starts per printer
+        self._stuck_workers: Dict[str, tuple] = {}  # thread/task workers that ignored a kill -> (worker info, last status)
+        self._etag_token = uuid.uuid4().hex[:8]  # keeps ETags from another process run apart
         
         self.loop: Optional[asyncio.AbstractEventLoop] = None
         self.loop_thread: Optional[threading.Thread] = None
@@ -42,6 +94,7 @@ class PrinterManager:
         """Run the asyncio event loop"""
         asyncio.set_event_loop(self.loop)
         self.loop.create_task(self._status_monitor_loop_async())
+        self.loop.create_task(self._supervise_workers())
         self.loop.run_forever()
 
     async def _status_monitor_loop_async(self):
@@ -53,31 +106,111 @@ class PrinterManager:
         while self.running:
             try:
                 status_update = await self.loop.run_in_executor(None, self.status_queue.get, True, 1.0)
-                if status_update:
-                    printer_name, status = status_update
-                    self.printer_statuses[printer_name] = status
+                # apply everything that piled up meanwhile in the same pass, a fixed
+                # pause per update would cap the whole fleet at a few updates per second
+                while status_update:
+                    self._apply_status_update(*status_update)
+                    status_update = self.status_queue.get_nowait()
             except Empty:
                 continue
             except Exception as e:
                 self.logger.error(f"Error in status monitor loop: {e}")
-            
-            await asyncio.sleep(0.1)
+                await asyncio.sleep(0.1)
     
+    def subscribe_status(self) -> StatusSubscription:
+        """Subscribe to printer status changes, from the caller's event loop"""
+        subscription = StatusSubscription(asyncio.get_running_loop())
+        self._status_subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe_status(self, subscription: StatusSubscription):
+        """Stop receiving printer status changes"""
+        self._status_subscriptions.discard(subscription)
+
+    def _publish_status(self, printer_name: str, status: Dict[str, Any]):
+        """Hand a status change to every subscriber, on their own loop"""
+        for subscription in list(self._status_subscriptions):
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.push, printer_name, status)
+            except RuntimeError:
+                # subscriber's loop is closed
+                self._status_subscriptions.discard(subscription)
+
+    def _set_printer_status(self, printer_name: str, status: Dict[str, Any]):
+        """Store the latest status of a printer, subscribers only hear about actual changes"""
+        if self.printer_statuses.get(printer_name) == status:
+            return
+        self.printer_statuses[printer_name] = status
+        self._status_revision += 1
+        self._publish_status(printer_name, status)
+
+    def _apply_status_update(self, printer_name: str, seq: int, fields: Dict[str, Any], full: bool):
+        """Merge a status update from a worker into the cached status.
+        A delta that doesn't directly follow the last applied one means an update
+        was lost, it is dropped and the worker is asked for a full status instead.
+        A None sequence is a heartbeat from the worker's command loop."""
+        if seq is None:
+            worker_info = self.workers.get(printer_name)
+            if worker_info:
+                worker_info['last_heartbeat'] = time.monotonic()
+            return
+
+        if full:
+            self._status_seqs[printer_name] = seq
+            self._set_printer_status(printer_name, fields)
+            return
+
+        last_seq = self._status_seqs.get(printer_name)
+        if last_seq is None or seq != last_seq + 1 or printer_name not in self.printer_statuses:
+            self.logger.warning(f"Lost status update for {printer_name} before #{seq}, requesting resync")
+            worker_info = self.workers.get(printer_name)
+            if worker_info:
+                worker_info['resync_event'].set()
+            self._status_seqs.pop(printer_name, None)
+            return
+
+        self._status_seqs[printer_name] = seq
+        self._set_printer_status(printer_name, {**self.printer_statuses[printer_name], **fields})
+
+    def _worker_lock(self, printer_name: str) -> threading.RLock:
+        """Lock held while checking and starting the worker of a printer"""
+        return self._worker_locks.setdefault(printer_name, threading.RLock())
+
     def _ensure_worker_running(self, printer_name: str) -> bool:
         """Ensure a worker process is running for the given printer"""
-        if printer_name in self.workers:
-            process = self.workers[printer_name]['process']
-            if process.is_alive():
-                return True
-            else:
-                # process died, clean it up
-                self.logger.warning(f"Worker process for {printer_name} died, cleaning up")
-                self._cleanup_worker(printer_name)
-        
-        return self._start_worker(printer_name)
+        with self._worker_lock(printer_name):
+            if printer_name in self.workers:
+                process = self.workers[printer_name]['process']
+                if process.is_alive():
+                    return True
+                else:
+                    # process died, clean it up
+                    self.logger.warning(f"Worker process for {printer_name} died, cleaning up")
+                    self._cleanup_worker(printer_name)
+
+            return self._start_worker(printer_name)
     
+    async def _ensure_worker(self, printer_name: str) -> bool:
+        """Ensure a worker is running, a start (process spawn, pipes) runs off the calling loop"""
+        worker_info = self.workers.get(printer_name)
+        if worker_info and worker_info['process'].is_alive():
+            return True
+        return await asyncio.to_thread(self._ensure_worker_running, printer_name)
+
     def _start_worker(self, printer_name: str) -> bool:
-        """Start a worker process for a printer"""
+        """Start a worker process for a printer, unless another caller already did"""
+        with self._worker_lock(printer_name):
+            worker_info = self.workers.get(printer_name)
+            if worker_info and worker_info['process'].is_alive():
+                return True  # started meanwhile, a second worker would fight it for the port
+            return self._launch_worker(printer_name)
+
+    def _launch_worker(self, printer_name: str) -> bool:
+        """Start a new worker for a printer, called with its worker lock held"""
+        if printer_name in self._stuck_workers:
+            self.logger.error(f"Previous worker for {printer_name} is still running, not starting another one")
+            return False
+
         is_available, printer_port = printer_config.is_printer_available(printer_name)
         if not is_available:
             self.logger.error(f"Printer {printer_name} not found in available printers")
@@ -88,30 +221,66 @@ class PrinterManager:
         display_name = printer_config_data.get('display_name', printer_name) if printer_config_data else printer_name
         preferred_baud = printer_config_data.get('preferred_baud') if printer_config_data else None
 
+        backend = printer_config.get_printer_worker_backend(printer_name) or WORKER_BACKEND
+        if backend not in WORKER_BACKENDS:
+            self.logger.warning(f"Unknown worker backend {backend} for {printer_name}, using a process")
+            backend = "process"
+
         try:
-            # create queues
-            command_queue = multiprocessing.Queue()
-            response_queue = multiprocessing.Queue()
-            
-            # start worker process
-            # TODO: use threads if in dev mode (because of daemon process not being able to spawn children)
-            process = multiprocessing.Process(
-                target=start_printer_worker,
-                args=(printer_name, printer_port, command_queue, response_queue, self.status_queue, preferred_baud),
-                name=f"PrinterWorker-{printer_name}"
-            )
-            process.start()
+            spare = self._take_spare_worker() if backend == "process" else None
+            if backend != "process":
+                # thread and task workers speak the same protocol, over a pipe inside the api process
+                conn, worker_conn = self.mp_context.Pipe(duplex=True)
+                resync_event = threading.Event()
+                process = start_worker_in_api(
+                    backend, printer_name, printer_port, worker_conn, self.status_queue,
+                    preferred_baud=preferred_baud, resync_event=resync_event
+                )
+            elif spare:
+                # warm process, it only needs to know which printer it drives
+                process, conn, resync_event = spare['process'], spare['conn'], spare['resync_event']
+                conn.send(WorkerCommand(action="assign", data={
+                    "printer_name": printer_name,
+                    "printer_port": printer_port,
+                    "preferred_baud": preferred_baud,
+                }))
+            else:
+                # duplex pipe carrying commands and their responses, matched by request id
+                conn, worker_conn = self.mp_context.Pipe(duplex=True)
+                resync_event = self.mp_context.Event()
+                
+                # start worker process
+                process = self.mp_context.Process(
+                    target=start_printer_worker,
+                    args=(printer_name, printer_port, worker_conn, self.status_queue, preferred_baud),
+                    kwargs={"resync_event": resync_event},
+                    name=f"PrinterWorker-{printer_name}"
+                )
+                process.start()
+                worker_conn.close()  # only the worker uses this end
+            if backend == "process":
+                self._refill_worker_pool()
             
             # store worker info
-            self.workers[printer_name] = {
+            worker_info = {
                 'process': process,
-                'command_queue': command_queue,
-                'response_queue': response_queue,
-                'port': printer_port
+                'conn': conn,
+                'pending': {},  # request id -> future waiting for the response
+                'request_ids': itertools.count(1),
+                'resync_event': resync_event,
+                'port': printer_port,
+                'started_at': time.monotonic(),
+                'last_heartbeat': time.monotonic(),
+                'sentinel': getattr(process, 'sentinel', None),  # readable once the process exited, processes only
+                'stopping': False,  # set when the stop is wanted, so the supervisor leaves it alone
             }
+            self.workers[printer_name] = worker_info
+            self._call_on_loop(self.loop.add_reader, conn.fileno(), self._read_responses, printer_name, worker_info)
+            if worker_info['sentinel'] is not None:
+                self._call_on_loop(self.loop.add_reader, worker_info['sentinel'], self._on_worker_exit, printer_name, worker_info)
             
             # init status
-            self.printer_statuses[printer_name] = {
+            self._set_printer_status(printer_name, {
                 "status": "disconnected",
                 "name": printer_name,
                 "display_name": display_name,
@@ -124,22 +293,219 @@ class PrinterManager:
                 "bedClear": False,
                 "bedTemp": {"current": 0, "target": 0},
                 "nozzleTemp": {"current": 0, "target": 0},
-            }
+            })
             
-            self.logger.info(f"Started worker for printer {printer_name} on {printer_port}")
+            self.logger.info(f"Started {backend} worker for printer {printer_name} on {printer_port}")
             return True
             
         except Exception as e:
             self.logger.error(f"Failed to start worker for {printer_name}: {e}")
             return False
+
+    def fill_worker_pool(self):
+        """Start idle worker processes until WORKER_POOL_SIZE of them are waiting"""
+        if WORKER_BACKEND != "process":
+            return
+        while self.running:
+            with self._pool_lock:
+                if len(self._spare_workers) + self._spare_starting >= WORKER_POOL_SIZE:
+                    return
+                self._spare_starting += 1
+
+            try:
+                conn, worker_conn = self.mp_context.Pipe(duplex=True)
+                resync_event = self.mp_context.Event()
+                process = self.mp_context.Process(
+                    target=run_pooled_worker,
+                    args=(worker_conn, self.status_queue, resync_event),
+                    name="PrinterWorker-spare"
+                )
+                process.start()
+                worker_conn.close()
+                with self._pool_lock:
+                    self._spare_workers.append({'process': process, 'conn': conn, 'resync_event': resync_event})
+            except Exception as e:
+                self.logger.error(f"Failed to start a spare worker: {e}")
+                return
+            finally:
+                with self._pool_lock:
+                    self._spare_starting -= 1
+
+    def _refill_worker_pool(self):
+        """Replace the spare workers that were taken, without holding up the caller"""
+        if WORKER_POOL_SIZE > 0 and self.running:
+            threading.Thread(target=self.fill_worker_pool, name="worker-pool", daemon=True).start()
+
+    def _take_spare_worker(self) -> Optional[Dict[str, Any]]:
+        """Pop an idle worker process from the pool, None when it is empty"""
+        with self._pool_lock:
+            while self._spare_workers:
+                spare = self._spare_workers.pop()
+                if spare['process'].is_alive():
+                    return spare
+                spare['conn'].close()
+        return None
+
+    def _stop_worker_pool(self):
+        """Stop the idle worker processes"""
+        with self._pool_lock:
+            spares, self._spare_workers = self._spare_workers, []
+        for spare in spares:
+            try:
+                spare['conn'].send(None)
+                spare['process'].join(timeout=2.0)
+                if spare['process'].is_alive():
+                    spare['process'].terminate()
+                spare['conn'].close()
+            except Exception as e:
+                self.logger.error(f"Failed to stop a spare worker: {e}")
     
+    def _call_on_loop(self, callback, *args):
+        """Run a callback on the manager loop, which owns the worker pipes"""
+        if self.loop.is_running() and threading.current_thread() is not self.loop_thread:
+            self.loop.call_soon_threadsafe(callback, *args)
+        else:
+            callback(*args)
+
+    def _read_responses(self, printer_name: str, worker_info: Dict[str, Any]):
+        """Resolve the pending requests of a worker from its pipe, runs on the manager loop"""
+        conn = worker_info['conn']
+        try:
+            while conn.poll():
+                response = conn.recv()
+                future = worker_info['pending'].get(response.request_id)
+                if future is None or future.done():
+                    # the caller already gave up on this request
+                    self.logger.debug(f"Discarding late response #{response.request_id} from {printer_name}")
+                    continue
+                future.set_result(response)
+        except (EOFError, OSError):
+            self.logger.warning(f"Lost connection to worker for {printer_name}")
+            self._close_channel(worker_info)
+
+    def _close_channel(self, worker_info: Dict[str, Any]):
+        """Stop reading a worker pipe and fail its pending requests, runs on the manager loop"""
+        if worker_info.get('sentinel') is not None:
+            try:
+                self.loop.remove_reader(worker_info['sentinel'])
+            except (ValueError, OSError):
+                pass
+        conn = worker_info['conn']
+        if not conn.closed:
+            try:
+                self.loop.remove_reader(conn.fileno())
+            except (ValueError, OSError):
+                pass
+            conn.close()
+        for future in worker_info['pending'].values():
+            if not future.done():
+                future.set_result(WorkerResponse(success=False, error="Printer worker stopped"))
+
     def _cleanup_worker(self, printer_name: str):
         """Clean up a worker process"""
         if printer_name in self.workers:
-            del self.workers[printer_name]
+            self._call_on_loop(self._close_channel, self.workers.pop(printer_name))
+        self._status_seqs.pop(printer_name, None)
         if printer_name in self.printer_statuses:
             del self.printer_statuses[printer_name]
+            self._status_revision += 1
+            self._publish_status(printer_name, self.get_printer_status(printer_name))
     
+    def _on_worker_exit(self, printer_name: str, worker_info: Dict[str, Any]):
+        """Process sentinel became readable: the worker process is gone, runs on the manager loop"""
+        self.loop.remove_reader(worker_info['sentinel'])
+        if worker_info['stopping'] or self.workers.get(printer_name) is not worker_info:
+            return
+        worker_info['process'].join(timeout=1.0)  # reap it, the sentinel fires right before the exit code is known
+        self._handle_worker_failure(printer_name, worker_info, f"exited with code {worker_info['process'].exitcode}")
+
+    async def _supervise_workers(self):
+        """Catch workers that died without a sentinel (threads, tasks) or stopped
+        sending heartbeats, and reset the backoff of the ones that stayed healthy"""
+        while self.running:
+            await asyncio.sleep(SUPERVISOR_INTERVAL)
+            now = time.monotonic()
+            for printer_name, (worker_info, last_status) in list(self._stuck_workers.items()):
+                if not worker_info['process'].is_alive():
+                    self.logger.info(f"Stuck worker for printer {printer_name} finally stopped")
+                    del self._stuck_workers[printer_name]
+                    self._schedule_restart(printer_name, last_status)
+            for printer_name, worker_info in list(self.workers.items()):
+                if worker_info['stopping']:
+                    continue
+                if not worker_info['process'].is_alive():
+                    self._handle_worker_failure(printer_name, worker_info, "stopped unexpectedly")
+                elif now - worker_info['last_heartbeat'] > HEARTBEAT_TIMEOUT:
+                    self._handle_worker_failure(printer_name, worker_info, f"sent no heartbeat for {HEARTBEAT_TIMEOUT:.0f}s")
+                elif now - worker_info['started_at'] > RESTART_STABLE_AFTER:
+                    self._restart_attempts.pop(printer_name, None)
+
+    def _handle_worker_failure(self, printer_name: str, worker_info: Dict[str, Any], reason: str):
+        """Drop a crashed or hung worker and schedule its restart, runs on the manager loop"""
+        self.logger.error(f"Worker for printer {printer_name} {reason}")
+        worker_info['stopping'] = True
+        in_process = worker_info['sentinel'] is None  # thread or task worker
+        if worker_info['process'].is_alive():
+            worker_info['process'].kill()  # hung, it won't react to a shutdown request
+            if not in_process:
+                worker_info['process'].join(timeout=1.0)  # a killed process reports alive until reaped
+
+        last_status = self.printer_statuses.get(printer_name)
+        self.workers.pop(printer_name, None)
+        self._close_channel(worker_info)
+        self._status_seqs.pop(printer_name, None)
+        if last_status:
+            # keep showing what the printer was doing until the new worker reports
+            self._set_printer_status(printer_name, {**last_status, "status": "disconnected"})
+        if in_process and worker_info['process'].is_alive():
+            # a thread or task can only be asked to stop, while it runs it may still hold
+            # the port and send G-code: no new worker until it is really gone
+            self.logger.error(f"Worker for printer {printer_name} can't be killed, restarting it once it stops")
+            self._stuck_workers[printer_name] = (worker_info, last_status)
+            return
+        self._schedule_restart(printer_name, last_status)
+
+    def _schedule_restart(self, printer_name: str, last_status: Optional[Dict[str, Any]]):
+        """Restart a worker after an exponential backoff on its crashes in a row"""
+        attempts = self._restart_attempts.get(printer_name, 0)
+        self._restart_attempts[printer_name] = attempts + 1
+        delay = min(RESTART_BACKOFF_MAX, RESTART_BACKOFF_BASE * 2 ** attempts)
+        self.logger.info(f"Restarting worker for printer {printer_name} in {delay:.0f}s")
+        self.loop.create_task(self._restart_worker(printer_name, last_status, delay))
+
+    async def _restart_worker(self, printer_name: str, last_status: Optional[Dict[str, Any]], delay: float):
+        """Start a new worker after a crash and bring the printer back to its last known state"""
+        await asyncio.sleep(delay)
+        if not self.running or printer_name in self.workers:
+            return  # shutting down, or a command already started a new worker
+
+        if not printer_config.is_printer_available(printer_name)[0]:
+            self.logger.warning(f"Printer {printer_name} is gone, not restarting its worker")
+            self._restart_attempts.pop(printer_name, None)
+            return
+
+        if not await asyncio.to_thread(self._start_worker, printer_name):
+            self._schedule_restart(printer_name, last_status)
+            return
+
+        if not last_status or last_status.get("status") == "disconnected":
+            return
+
+        queue_item_id = last_status.get("currentQueueItem")
+        if queue_item_id:
+            # the print died with the worker, the board most likely reset when its port closed
+            queue_item = queue_manager.get_queue_item_by_id(queue_item_id)
+            if queue_item and queue_item.status == "printing":
+                queue_manager.mark_print_failed(queue_item_id, "Printer worker crashed during the print")
+
+        response = await self.connect_printer(
+            printer_name,
+            last_status.get("baud") or None,
+            bed_clear=last_status.get("bedClear", False) and not queue_item_id,
+        )
+        if not response or not response.success:
+            self.logger.error(f"Failed to reconnect {printer_name} after a restart: {response.error if response else 'no response'}")
+
     def _stop_worker(self, printer_name: str) -> bool:
         """Stop a worker process for a printer"""
         if printer_name not in self.workers:
@@ -147,10 +513,11 @@ class PrinterManager:
         
         try:
             worker_info = self.workers[printer_name]
+            worker_info['stopping'] = True
             process = worker_info['process']
 
-            # send shutdown command
-            worker_info['command_queue'].put(None)
+            # send shutdown command, from the manager loop which owns the pipe's writing end
+            self._call_on_loop(worker_info['conn'].send, None)
 
             # wait for process to terminate
             process.join(timeout=5.0)
@@ -175,22 +542,31 @@ class PrinterManager:
     
     async def _send_command(self, printer_name: str, command: WorkerCommand, timeout: float = 10.0) -> Optional[WorkerResponse]:
         """Asynchronously send a command to a printer worker, safely callable from another loop."""
-        if not self._ensure_worker_running(printer_name):
+        if not await self._ensure_worker(printer_name):
             return WorkerResponse(success=False, error="Failed to start printer worker")
 
         async def _send_and_receive():
+            worker_info = self.workers.get(printer_name)
+            if worker_info is None:
+                return WorkerResponse(success=False, error="Printer worker stopped")
+
+            # send cmd and await the response carrying the same request id
+            request_id = next(worker_info['request_ids'])
+            future = self.loop.create_future()
+            worker_info['pending'][request_id] = future
             try:
-                # send cmd an await response
-                worker_info = self.workers[printer_name]
-                await self.loop.run_in_executor(None, worker_info['command_queue'].put, command)
-                f = self.loop.run_in_executor(None, worker_info['response_queue'].get, True, timeout)
-                return await f 
+                worker_info['conn'].send(WorkerCommand(action=command.action, data=command.data, request_id=request_id))
+                # the worker also queued the status carried by the response as a numbered
+                # update, merging it here would leave the worker's delta baseline behind
+                return await asyncio.wait_for(future, timeout)
                 
-            except Empty:
+            except asyncio.TimeoutError:
                 return WorkerResponse(success=False, error="Command timeout")
             except Exception as e:
                 self.logger.error(f"Failed to send command to {printer_name}: {e}")
                 return WorkerResponse(success=False, error=str(e))
+            finally:
+                worker_info['pending'].pop(request_id, None)
 
         # check if the current loop is the same as the manager's loop
         current_loop = asyncio.get_running_loop()
@@ -240,33 +616,77 @@ class PrinterManager:
             "nozzleTemp": {"current": 0, "target": 0},
         }
     
-    def get_all_printer_statuses(self) -> Dict[str, Dict[str, Any]]:
+    def get_status_etag(self, printer_names: list[str]) -> str:
+        """ETag of the statuses of the given printers, changes when printers appear or vanish"""
+        printers = zlib.crc32(",".join(printer_names).encode())
+        return f'"{self._etag_token}-{self._status_revision}-{printers:x}"'
+
+    def get_all_printer_statuses(self, printer_names: Optional[list[str]] = None) -> Dict[str, Dict[str, Any]]:
         """Get status of all available printers"""
         statuses = {}
-        for printer_name in self.list_available_printers():
+        for printer_name in printer_names if printer_names is not None else self.list_available_printers():
             statuses[printer_name] = self.get_printer_status(printer_name)
         return statuses
     
-    async def connect_printer(self, printer_name: str, baud: Optional[int] = None) -> Optional[WorkerResponse]:
-        """Connect to a printer"""
-        # Use preferred baud rate if no baud specified
-        if baud is None:
-            preferred_baud = printer_config.get_printer_preferred_baud(printer_name)
-            if preferred_baud:
-                baud = preferred_baud
-        
-        command = WorkerCommand(action="connect", data={"baud": baud} if baud else None)
-        return await self._send_command(printer_name, command)
+    async def connect_printer(self, printer_name: str, baud: Optional[int] = None, bed_clear: Optional[bool] = None) -> Optional[WorkerResponse]:
+        """Connect to a printer, bed_clear restores the bed state known before a worker restart"""
+        # without an explicit baud rate the worker tries the saved one, then
+        # detects it trying the most likely rates first
+        preferred_baud = printer_config.get_printer_preferred_baud(printer_name)
+        baudrates = printer_config.get_baud_candidates(printer_name)
+        command = WorkerCommand(action="connect", data={
+            "baud": baud,
+            "preferred_baud": preferred_baud,
+            "baudrates": baudrates,
+            "bed_clear": bed_clear,
+        })
+        timeout = CONNECT_TIMEOUT
+        if not baud:
+            # worst case: the saved rate is stale and every rate has to be probed
+            timeout += utils.BAUD_PROBE_TIMEOUT * len(baudrates) + (CONNECT_TIMEOUT if preferred_baud else 0)
+        response = await self._send_command(printer_name, command, timeout=timeout)
+
+        if response and response.success and response.data and response.data.get("baud") and not baud:
+            # saved so the next connect skips the detection
+            printer_config.set_printer_preferred_baud(printer_name, response.data["baud"])
+        return response
     
     async def disconnect_printer(self, printer_name: str) -> Optional[WorkerResponse]:
         """Disconnect from a printer"""
         command = WorkerCommand(action="disconnect")
         response = await self._send_command(printer_name, command)
         
-        # Also stop the worker process
-        self._stop_worker(printer_name)
+        # Also stop the worker process, joining it off the loop
+        await asyncio.to_thread(self._stop_worker, printer_name)
         
         return response
+
+    async def _for_printers(self, printer_names: list[str], action) -> Dict[str, WorkerResponse]:
+        """Run an action on several printers at once, at most FLEET_CONCURRENCY at a time"""
+        semaphore = asyncio.Semaphore(FLEET_CONCURRENCY)
+
+        async def run(printer_name: str) -> WorkerResponse:
+            async with semaphore:
+                try:
+                    return await action(printer_name) or WorkerResponse(success=False, error="No response from printer worker")
+                except Exception as e:
+                    self.logger.error(f"Fleet action failed on {printer_name}: {e}")
+                    return WorkerResponse(success=False, error=str(e))
+
+        responses = await asyncio.gather(*(run(printer_name) for printer_name in printer_names))
+        return dict(zip(printer_names, responses))
+
+    async def connect_all(self, printer_names: Optional[list[str]] = None, baud: Optional[int] = None) -> Dict[str, WorkerResponse]:
+        """Connect several printers in parallel, every available one by default"""
+        if printer_names is None:
+            printer_names = self.list_available_printers()
+        return await self._for_printers(printer_names, lambda printer_name: self.connect_printer(printer_name, baud))
+
+    async def disconnect_all(self, printer_names: Optional[list[str]] = None) -> Dict[str, WorkerResponse]:
+        """Disconnect several printers in parallel, every one with a running worker by default"""
+        if printer_names is None:
+            printer_names = self.list_active_workers()
+        return await self._for_printers(printer_names, self.disconnect_printer)
     
     async def send_printer_command(self, printer_name: str, gcode_command: str) -> Optional[WorkerResponse]:
         """Send a G-code command to a printer"""
@@ -296,7 +716,7 @@ class PrinterManager:
     async def start_print_from_queue(self, printer_name: str, queue_item_id: str) -> Optional[WorkerResponse]:
         """Start printing from a queue item"""
         # try to start the worker if not already running
-        if not self._ensure_worker_running(printer_name):
+        if not await self._ensure_worker(printer_name):
             return WorkerResponse(success=False, error="Failed to start printer worker")
         
         # if not connected, connect first
@@ -327,6 +747,7 @@ class PrinterManager:
         # Stop all workers
         for printer_name in list(self.workers.keys()):
             self._stop_worker(printer_name)
+        self._stop_worker_pool()
         
         # Stop status monitoring thread
         if self.loop and self.loop.is_running():
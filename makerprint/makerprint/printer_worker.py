@@ -6,6 +6,7 @@ import os
 import time
 import multiprocessing
 import signal
+from multiprocessing.connection import Connection, wait
 from typing import Dict, Any, Optional
 from dataclasses import dataclass
 
@@ -17,8 +18,9 @@ from .config import printer_config
 @dataclass
 class WorkerCommand:
     """Command to send to printer worker"""
-    action: str  # connect, disconnect, command, start, start_queue_item, pause, resume, stop, status, clear_bed, mark_finished, mark_failed
+    action: str  # assign, connect, disconnect, command, start, start_queue_item, pause, resume, stop, status, clear_bed, mark_finished, mark_failed
     data: Optional[Dict[str, Any]] = None
+    request_id: Optional[int] = None  # echoed back in the response
 
 
 @dataclass
@@ -27,34 +29,46 @@ class WorkerResponse:
     success: bool
     data: Optional[Dict[str, Any]] = None
     error: Optional[str] = None
+    request_id: Optional[int] = None  # id of the command this answers
 
 
 class PrinterWorkerProcess:
     """Worker process that manages a single printer"""
     DEFAULT_MONITOR_INTERVAL = 2.5
+    HEARTBEAT_INTERVAL = 2.0  # seconds between two heartbeats, sent while the command loop is responsive
     
     def __init__(self, printer_name: str, printer_port: str, 
-                 command_queue: multiprocessing.Queue, 
-                 response_queue: multiprocessing.Queue, 
+                 conn: Connection,
                  status_queue: multiprocessing.Queue,
                  preferred_baud: Optional[int] = None,
-                 monitor_interval: float = None):
+                 monitor_interval: float = None,
+                 resync_event: Optional[multiprocessing.Event] = None,
+                 handle_signals: bool = True):
         self.printer_name = printer_name
         self.printer_port = printer_port
-        self.command_queue = command_queue
-        self.response_queue = response_queue
+        self.conn = conn  # commands in, responses out
         self.status_queue = status_queue
         self.printer: Optional[Printer] = None
         self.running = True
         
         self.logger = utils.logger.getChild(f"worker-{printer_name}")
         
-        signal.signal(signal.SIGTERM, self._signal_handler)
-        signal.signal(signal.SIGINT, self._signal_handler)
+        if handle_signals:
+            # only in a process of its own, thread and task workers belong to the api process
+            signal.signal(signal.SIGTERM, self._signal_handler)
+            signal.signal(signal.SIGINT, self._signal_handler)
         
         self.monitor_interval = monitor_interval or self.DEFAULT_MONITOR_INTERVAL
         self.preferred_baud = preferred_baud
         self._last_status_update = 0
+        self._last_heartbeat = 0
+        self._parent = multiprocessing.parent_process()  # None when running inside the api process
+
+        # status updates only carry the fields that changed, numbered so the
+        # manager can detect a lost update and ask for a full one through resync_event
+        self.resync_event = resync_event
+        self._status_seq = 0
+        self._last_sent_status: Optional[Dict[str, Any]] = None
     
     def _signal_handler(self, signum, frame):
         """Handle shutdown signals"""
@@ -75,8 +89,7 @@ class PrinterWorkerProcess:
         try:
             if self.printer:
                 status = self.printer.get_status()
-                status_dict = status.model_dump()
-                self.status_queue.put((self.printer_name, status_dict))
+                self._put_status(status.model_dump())
             else:
                 self._send_disconnected_status()
         except Exception as e:
@@ -95,28 +108,91 @@ class PrinterWorkerProcess:
             baud=0,
             progress=0
         )
-        self.status_queue.put((self.printer_name, default_status.model_dump()))
+        self._put_status(default_status.model_dump())
+
+    def _heartbeat(self):
+        """Tell the manager the worker is still responsive, a None sequence marks a heartbeat"""
+        now = time.monotonic()
+        if now - self._last_heartbeat >= self.HEARTBEAT_INTERVAL:
+            self._last_heartbeat = now
+            self.status_queue.put((self.printer_name, None, None, False))
+
+    async def _heartbeat_loop(self):
+        """Keep heartbeats going while a long command (connect) runs on the event loop"""
+        while True:
+            self._heartbeat()
+            await asyncio.sleep(self.HEARTBEAT_INTERVAL / 2)
+
+    def _put_status(self, status_dict: Dict[str, Any]):
+        """Send the fields that changed since the last update, or the whole
+        status for the first update and when the manager asked for a resync"""
+        full = self._last_sent_status is None or (self.resync_event is not None and self.resync_event.is_set())
+        if full:
+            if self.resync_event is not None:
+                self.resync_event.clear()
+            fields = status_dict
+        else:
+            fields = {
+                key: value for key, value in status_dict.items()
+                if self._last_sent_status.get(key) != value
+            }
+            if not fields:
+                return
+
+        self._status_seq += 1
+        self.status_queue.put((self.printer_name, self._status_seq, fields, full))
+        self._last_sent_status = status_dict
+
+    def _reply(self, command: WorkerCommand, response: WorkerResponse):
+        """Answer a command, the status it carries goes through the numbered
+        updates too so the manager and the delta baseline stay in step"""
+        if response.success and response.data and "status" in response.data:
+            self._put_status(response.data)
+        response.request_id = command.request_id
+        self.conn.send(response)
     
     def _process_connect(self, data: Optional[Dict[str, Any]]) -> WorkerResponse:
         """Connect to the printer"""
+        return asyncio.run(self._connect(data))
+
+    async def _connect(self, data: Optional[Dict[str, Any]]) -> WorkerResponse:
+        """Connect to the printer, on the caller's event loop"""
+        heartbeat = asyncio.create_task(self._heartbeat_loop())
         try:
             if self.printer and self.printer.online:
                 return WorkerResponse(success=True, data=self.printer.get_status().model_dump())
 
-            baud = data.get("baud") if data else None
-            baud = baud or self.preferred_baud
+            data = data or {}
+            baud = data.get("baud")
+            remembered = data.get("preferred_baud") or self.preferred_baud
             printer_config_data = printer_config.get_printer_by_name(self.printer_name)
             display_name = printer_config_data.get('display_name', self.printer_name) if printer_config_data else self.printer_name
             
             self.printer = Printer(
                 self.printer_port, 
-                baud=baud, 
+                baud=baud or remembered, 
                 printer_name=self.printer_name, 
                 display_name=display_name,
-                temp_update_callback=self._on_temperature_update
+                temp_update_callback=self._on_temperature_update,
+                baud_candidates=data.get("baudrates")
             )
             
-            asyncio.run(self.printer.connect())
+            try:
+                await self.printer.connect()
+            except Exception as e:
+                if baud or not remembered:
+                    raise
+                # the saved baudrate is stale (firmware flashed, board swapped), detect it again
+                self.logger.warning(f"No answer at saved baud rate {remembered} on {self.printer_port}, detecting it: {e}")
+                self.printer.disconnect()
+                self.printer.baud = None
+                self.printer.baud_candidates = [rate for rate in data.get("baudrates") or utils.BAUDRATES if rate != remembered]
+                await self.printer.connect()
+            
+            self.preferred_baud = self.printer.baud
+            if data.get("bed_clear") is not None:
+                # restored after a worker restart, a print may have been left on the bed
+                self.printer.bed_clear = data["bed_clear"]
             
             self.logger.info(f"Connected to printer {self.printer_name} on {self.printer_port}")
             return WorkerResponse(success=True, data=self.printer.get_status().model_dump())
@@ -124,6 +200,8 @@ class PrinterWorkerProcess:
         except Exception as e:
             self.logger.error(f"Failed to connect to {self.printer_name}: {e}")
             return WorkerResponse(success=False, error=str(e))
+        finally:
+            heartbeat.cancel()
     
     def _process_disconnect(self) -> WorkerResponse:
         """Disconnect from the printer"""
@@ -316,54 +394,145 @@ class PrinterWorkerProcess:
             self.logger.error(f"Error processing command {command.action}: {e}")
             return WorkerResponse(success=False, error=str(e))
     
+    async def _handle_command_async(self, command: WorkerCommand) -> WorkerResponse:
+        """Process a command without blocking the event loop shared with other printers,
+        the synchronous handlers (serial writes, database, startprint) run in a thread"""
+        if command.action == "connect":
+            return await self._connect(command.data)
+        return await asyncio.to_thread(self._handle_command, command)
+
+    def _close(self):
+        """Release the printer and the pipe once the worker loop is over"""
+        if self.printer:
+            try:
+                self.printer.disconnect()
+            except:
+                pass
+        try:
+            self.conn.close()
+        except:
+            pass
+        self.logger.info(f"Printer worker for {self.printer_name} shutting down")
+
+    async def run_async(self):
+        """Worker loop of the task backend, sharing its event loop with other printers"""
+        self.logger.info(f"Starting printer worker task for {self.printer_name} on {self.printer_port}")
+        loop = asyncio.get_running_loop()
+        readable = asyncio.Event()
+        fileno = self.conn.fileno()
+        loop.add_reader(fileno, readable.set)
+
+        try:
+            while self.running:
+                self._heartbeat()
+                try:
+                    # woken up by the pipe, the timeout only catches running turning False
+                    await asyncio.wait_for(readable.wait(), 0.5)
+                except asyncio.TimeoutError:
+                    continue
+                readable.clear()
+
+                while self.running and self.conn.poll():
+                    command = self.conn.recv()
+                    if command is None:  # Shutdown signal
+                        self.running = False
+                        break
+
+                    try:
+                        response = await self._handle_command_async(command)
+                    except Exception as e:
+                        self.logger.error(f"Error in worker loop: {e}")
+                        response = WorkerResponse(success=False, error=str(e))
+                    self._reply(command, response)
+
+        except (EOFError, OSError):
+            self.logger.warning("Lost connection to the printer manager")
+        finally:
+            loop.remove_reader(fileno)
+            self._close()
+
     def run(self):
         """Main worker loop"""
         self.logger.info(f"Starting printer worker for {self.printer_name} on {self.printer_port}")
         
         try:
             while self.running:
+                command = None
+                self._heartbeat()
                 try:
                     # Wait for commands with timeout
-                    command = self.command_queue.get(timeout=0.1)
+                    if not self.conn.poll(0.1):
+                        if self._parent is not None and not self._parent.is_alive():
+                            # siblings keep the pipe open, don't hold the serial port for nobody
+                            self.logger.warning("Printer manager is gone")
+                            break
+                        continue
+                    command = self.conn.recv()
                     
                     if command is None:  # Shutdown signal
                         break
                     
                     response = self._handle_command(command)
-                    self.response_queue.put(response)
+                    self._reply(command, response)
                     
-                except multiprocessing.queues.Empty:
-                    continue
+                except (EOFError, OSError):
+                    self.logger.warning("Lost connection to the printer manager")
+                    break
                 except Exception as e:
                     self.logger.error(f"Error in worker loop: {e}")
-                    error_response = WorkerResponse(success=False, error=str(e))
+                    error_response = WorkerResponse(
+                        success=False, error=str(e),
+                        request_id=command.request_id if command else None
+                    )
                     try:
-                        self.response_queue.put(error_response)
+                        self.conn.send(error_response)
                     except:
                         pass
                         
         except Exception as e:
             self.logger.error(f"Fatal error in worker: {e}")
         finally:
-            # Cleanup
-            if self.printer:
-                try:
-                    self.printer.disconnect()
-                except:
-                    pass
-            self.logger.info(f"Printer worker for {self.printer_name} shutting down")
+            self._close()
 
 
 def start_printer_worker(printer_name: str, printer_port: str, 
-                         command_queue: multiprocessing.Queue,
-                         response_queue: multiprocessing.Queue, 
+                         conn: Connection,
                          status_queue: multiprocessing.Queue,
                          preferred_baud: Optional[int] = None,
-                         monitor_interval: float = None):
+                         monitor_interval: float = None,
+                         resync_event: Optional[multiprocessing.Event] = None):
     """Entry point for starting a printer worker process"""
     worker = PrinterWorkerProcess(
-        printer_name, printer_port, command_queue, response_queue, status_queue,
+        printer_name, printer_port, conn, status_queue,
         monitor_interval=monitor_interval,
-        preferred_baud=preferred_baud
+        preferred_baud=preferred_baud,
+        resync_event=resync_event
     )
     worker.run()
+
+
+def run_pooled_worker(conn: Connection,
+                      status_queue: multiprocessing.Queue,
+                      resync_event: Optional[multiprocessing.Event] = None,
+                      monitor_interval: float = None):
+    """Entry point of a pre-started worker process: it waits, imports already
+    done, until the manager assigns it a printer, then runs as its worker"""
+    # forked siblings also hold the manager's end of this pipe, so its EOF can't be
+    # relied on to notice the manager is gone: watch the parent process as well
+    parent = multiprocessing.parent_process()
+    try:
+        if conn not in wait([conn] + ([parent.sentinel] if parent else [])):
+            return
+        assignment = conn.recv()
+    except (EOFError, OSError, KeyboardInterrupt):
+        return
+    if assignment is None or assignment.action != "assign":
+        return
+
+    data = assignment.data
+    start_printer_worker(
+        data["printer_name"], data["printer_port"], conn, status_queue,
+        preferred_baud=data.get("preferred_baud"),
+        monitor_interval=monitor_interval,
+        resync_event=resync_event
+    )
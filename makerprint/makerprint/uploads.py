@@ -0,0 +1,162 @@
+"""
+Uploads - Stream multipart uploads straight to the blob store
+"""
+import asyncio
+import os
+from dataclasses import dataclass, field
+from typing import AsyncIterator, List, Optional
+
+from python_multipart.multipart import MultipartParser, parse_options_header
+
+from . import utils
+from .file_manager import UPLOAD_CHUNK_SIZE, BlobWriter, FileManager
+
+MAX_FIELD_SIZE = 64 * 1024  # bytes kept of a plain form field, like folder_path
+MAX_UPLOAD_FILES = int(os.environ.get("MAX_UPLOAD_FILES", 20))  # files per upload request
+MAX_BODY_OVERHEAD = 1 << 20  # bytes of boundaries, part headers and fields allowed on top of the files
+
+
+class UploadError(Exception):
+    """The request body is refused, status_code is the http status to answer with"""
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+@dataclass
+class UploadedPart:
+    """One part of a multipart body, a file when it has a filename"""
+    name: str = ""
+    filename: Optional[str] = None
+    writer: Optional[BlobWriter] = None
+    pending: bytearray = field(default_factory=bytearray)  # file data not written to the blob yet
+    value: bytearray = field(default_factory=bytearray)  # content of a plain field
+    digest: Optional[str] = None
+    size: int = 0
+    ended: bool = False
+
+
+class UploadParser:
+    """Reads a multipart body chunk by chunk. File data goes to a blob of the
+    store as it arrives, so an upload is written once. The whole request is
+    refused, and reading stops, as soon as a file is refused or crosses
+    MAX_UPLOAD_SIZE, or the body outgrows what MAX_UPLOAD_FILES such files need."""
+
+    def __init__(self, file_manager: FileManager, content_type: str, file_field: str = "files"):
+        content_type, params = parse_options_header(content_type)
+        if content_type != b"multipart/form-data" or b"boundary" not in params:
+            raise UploadError("Expected a multipart/form-data body")
+        self.file_manager = file_manager
+        self.file_field = file_field
+        self.parts: List[UploadedPart] = []
+        self.max_body_size = (utils.MAX_UPLOAD_SIZE * MAX_UPLOAD_FILES + MAX_BODY_OVERHEAD) if utils.MAX_UPLOAD_SIZE else 0
+        self._received = 0
+        self._part: Optional[UploadedPart] = None
+        self._header_field = bytearray()
+        self._header_value = bytearray()
+        self._headers = {}
+        self._parser = MultipartParser(params[b"boundary"], {
+            "on_part_begin": self._on_part_begin,
+            "on_header_field": lambda data, start, end: self._header_field.extend(data[start:end]),
+            "on_header_value": lambda data, start, end: self._header_value.extend(data[start:end]),
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end,
+        })
+
+    def _on_part_begin(self):
+        self._part = UploadedPart()
+        self._headers = {}
+        self.parts.append(self._part)
+
+    def _on_header_end(self):
+        self._headers[bytes(self._header_field).lower()] = bytes(self._header_value)
+        self._header_field.clear()
+        self._header_value.clear()
+
+    def _on_headers_finished(self):
+        part = self._part
+        _, options = parse_options_header(self._headers.get(b"content-disposition"))
+        part.name = options.get(b"name", b"").decode("utf-8", "replace")
+        if b"filename" not in options:
+            return
+        part.filename = options[b"filename"].decode("utf-8", "replace")
+        if part.name != self.file_field:
+            raise UploadError(f"Unexpected file field {part.name}")
+        if not part.filename.endswith(".gcode"):
+            raise UploadError(f"{part.filename}: file must be a .gcode file")
+        if len(self.files()) > MAX_UPLOAD_FILES:
+            raise UploadError(f"At most {MAX_UPLOAD_FILES} files can be uploaded at once", 413)
+
+    def _on_part_data(self, data: bytes, start: int, end: int):
+        part = self._part
+        if part.filename is None:
+            if len(part.value) + end - start > MAX_FIELD_SIZE:
+                raise UploadError(f"Form field {part.name} is too large")
+            part.value.extend(data[start:end])
+        else:
+            part.size += end - start
+            if utils.MAX_UPLOAD_SIZE and part.size > utils.MAX_UPLOAD_SIZE:
+                raise UploadError(f"{part.filename} exceeds the maximum upload size of {utils.MAX_UPLOAD_SIZE} bytes", 413)
+            part.pending.extend(data[start:end])
+
+    def _on_part_end(self):
+        self._part.ended = True
+
+    async def _flush(self, part: UploadedPart):
+        """Write the buffered data of a file part, off the event loop"""
+        if part.digest is not None:
+            return
+        if part.writer is None:
+            part.writer = await asyncio.to_thread(self.file_manager.open_blob)
+        data, part.pending = bytes(part.pending), bytearray()
+        if data:
+            await asyncio.to_thread(part.writer.write, data)
+        if part.ended:
+            part.digest = await asyncio.to_thread(self.file_manager.commit_blob, part.writer)
+            part.writer = None
+
+    async def parse(self, stream: AsyncIterator[bytes]):
+        """Consume the body, raises UploadError as soon as it is refused"""
+        try:
+            async for chunk in stream:
+                self._received += len(chunk)
+                if self.max_body_size and self._received > self.max_body_size:
+                    raise UploadError(f"Upload exceeds {self.max_body_size} bytes", 413)
+                try:
+                    self._parser.write(chunk)
+                except UploadError:
+                    raise
+                except Exception as e:
+                    raise UploadError(f"Invalid multipart body: {e}")
+                for part in self.files():
+                    if part.ended or len(part.pending) >= UPLOAD_CHUNK_SIZE:
+                        await self._flush(part)
+            self._parser.finalize()
+            if self._part is not None and not self._part.ended:
+                raise UploadError("Incomplete multipart body")
+            for part in self.files():
+                await self._flush(part)
+        except BaseException:
+            for part in self.parts:
+                if part.writer is not None:
+                    part.writer.discard()
+            self.discard()
+            raise
+
+    def discard(self):
+        """Release the blobs stored for this upload that no file uses"""
+        self.file_manager.release_blobs([part.digest for part in self.files() if part.digest])
+
+    def field(self, name: str, default: str = "") -> str:
+        """Value of a plain form field"""
+        for part in self.parts:
+            if part.filename is None and part.name == name:
+                return part.value.decode("utf-8", "replace")
+        return default
+
+    def files(self) -> List[UploadedPart]:
+        """File parts of the body"""
+        return [part for part in self.parts if part.filename is not None]
@@ -14,6 +14,12 @@ LOGPATH = os.environ.get("LOGPATH", "log.txt")
 LOGLEVEL = os.environ.get("LOGLEVEL", "DEBUG").upper()
 LOGPATH = os.environ.get("LOGPATH", "log.txt")
 GCODEFOLDER = os.environ.get("GCODEFOLDER", "data")
+QUEUE_ARCHIVE_DELAY = float(os.environ.get("QUEUE_ARCHIVE_DELAY", 24 * 3600))  # seconds before completed items leave the queue
+HISTORY_RETENTION_DAYS = float(os.environ.get("HISTORY_RETENTION_DAYS", 0))  # 0 keeps history forever
+HISTORY_COMPACT = os.environ.get("HISTORY_COMPACT", "true").lower() == "true"  # VACUUM after purging history
+MAX_UPLOAD_SIZE = int(os.environ.get("MAX_UPLOAD_SIZE", 4 * 1024 ** 3))  # bytes per uploaded file, 0 disables the limit
+BAUD_PROBE_TIMEOUT = float(os.environ.get("BAUD_PROBE_TIMEOUT", 4))  # seconds to wait for an answer at each baudrate
+BAUD_GARBAGE_LIMIT = 8  # unprintable bytes after which a baudrate is considered wrong
 BAUDRATES = [
     250000,
     115200,
@@ -82,50 +88,74 @@ def create_mock_printer(i):
     ]
 
 
-async def auto_detect_baud(port, ser_timeout=1, timeout=5) -> int | bool:
-    """Small utility to auto-detect the baud rate for a 3d printer."""
+def _is_printer_reply(line: bytes) -> bool:
+    return b"ok" in line or b"T:" in line or b"echo:" in line or b"error:" in line or line.strip() == b"start"
 
-    for baud in BAUDRATES:
+
+def _is_garbage(data: bytes) -> bool:
+    """Bytes read at the wrong baudrate are mostly not printable"""
+    noise = sum(1 for byte in data if byte > 126 or (byte < 32 and byte not in b"\r\n\t"))
+    return noise >= BAUD_GARBAGE_LIMIT and noise * 4 >= len(data)
+
+
+async def auto_detect_baud(port, baudrates=None, ser_timeout=1, timeout=BAUD_PROBE_TIMEOUT, poll_interval=0.05) -> int | bool:
+    """Small utility to auto-detect the baud rate for a 3d printer.
+
+    Rates are tried in the given order, most likely first. The port is read
+    without blocking so the event loop keeps running, and a rate is dropped
+    as soon as the printer answers with noise instead of waiting for the timeout."""
+    loop = asyncio.get_running_loop()
+
+    for baud in baudrates or BAUDRATES:
         ser = None
         try:
             logger.debug(f"Trying baud rate {baud} for {port}")
             ser = serial.Serial(
                 port=port,
                 baudrate=baud,
-                timeout=ser_timeout,
+                timeout=0,  # reads return what is buffered right away
                 write_timeout=ser_timeout,
             )
 
-            start_time = asyncio.get_event_loop().time()
-            timeout_time = start_time + timeout
-
             ser.write(b"\n")
             ser.reset_input_buffer()
             ser.reset_output_buffer()
-            ser.flush()
 
-            ser.write(b"M105\n")  # temperature report command, should output something like "T:200.0 /200.0 B:60.0 /60.0"
-            # ser.write(b"M155 S4\n")  # Set auto-report temperature every 4 seconds
-
-            while asyncio.get_event_loop().time() < timeout_time:
-                line = ser.readline(100)
-                if b"ok" in line or b"T:" in line or b"echo:" in line or b"error:" in line:
+            timeout_time = loop.time() + timeout
+            next_query = loop.time()
+            received = b""
+            pending = b""
+            while loop.time() < timeout_time:
+                if loop.time() >= next_query:
+                    # asked again every second, boards resetting on open miss the first one
+                    ser.write(b"M105\n")  # temperature report command, should output something like "T:200.0 /200.0 B:60.0 /60.0"
+                    next_query = loop.time() + 1
+
+                chunk = ser.read(ser.in_waiting or 1)
+                if not chunk:
+                    await asyncio.sleep(poll_interval)
+                    continue
+
+                received += chunk
+                *lines, pending = (pending + chunk).split(b"\n")
+                if any(_is_printer_reply(line) for line in lines):
                     logger.debug(f"Detected baud rate {baud} for {port}")
-                    ser.close() # close the serial port for later use
                     return baud
-                elif line:
-                    logger.debug(f"Received line: {line.decode('utf-8', errors='ignore').strip()}")
-            
-            ser.close()
-            logger.debug(f"No response from {port} at {baud} baud")
+                for line in lines:
+                    if line.strip():
+                        logger.debug(f"Received line: {line.decode('utf-8', errors='ignore').strip()}")
+                if _is_garbage(received):
+                    logger.debug(f"Unreadable answer from {port} at {baud} baud")
+                    break
+            else:
+                logger.debug(f"No response from {port} at {baud} baud")
 
         except (serial.SerialException, ValueError) as e:
             logger.warning(f"Failed to connect to {port} at {baud} baud: {e}")
 
         finally:
             if ser and ser.is_open:
-                ser.close()
+                ser.close() # close the serial port for later use
 
     logger.error(f"Failed to auto-detect baud rate for {port}")
     return False
-
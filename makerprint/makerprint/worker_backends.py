@@ -0,0 +1,91 @@
+"""
+Worker Backends - Run a printer worker in a thread or an asyncio task of the api process
+"""
+import asyncio
+import threading
+from typing import Optional
+
+from .printer_worker import PrinterWorkerProcess
+
+WORKER_BACKENDS = ("process", "thread", "task")
+
+
+class ThreadWorker:
+    """Printer worker running in a thread, handled like a multiprocessing.Process"""
+
+    def __init__(self, worker: PrinterWorkerProcess, name: str):
+        self.worker = worker
+        self.name = name
+        self.pid = None
+        self._thread = threading.Thread(target=worker.run, name=name, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def is_alive(self) -> bool:
+        return self._thread.is_alive()
+
+    def join(self, timeout: Optional[float] = None):
+        self._thread.join(timeout)
+
+    def terminate(self):
+        """A thread can't be killed, ask the worker loop to stop"""
+        self.worker.running = False
+
+    kill = terminate
+
+
+class TaskWorker:
+    """Printer worker running as a task on the event loop shared by all task workers"""
+
+    _loop: Optional[asyncio.AbstractEventLoop] = None
+    _loop_lock = threading.Lock()
+
+    def __init__(self, worker: PrinterWorkerProcess, name: str):
+        self.worker = worker
+        self.name = name
+        self.pid = None
+        self._future = None
+
+    @classmethod
+    def _shared_loop(cls) -> asyncio.AbstractEventLoop:
+        with cls._loop_lock:
+            if cls._loop is None:
+                cls._loop = asyncio.new_event_loop()
+                threading.Thread(target=cls._loop.run_forever, name="printer-tasks", daemon=True).start()
+            return cls._loop
+
+    def start(self):
+        self._future = asyncio.run_coroutine_threadsafe(self.worker.run_async(), self._shared_loop())
+
+    def is_alive(self) -> bool:
+        return self._future is not None and not self._future.done()
+
+    def join(self, timeout: Optional[float] = None):
+        if self._future is None:
+            return
+        try:
+            self._future.result(timeout)
+        except Exception:
+            pass
+
+    def terminate(self):
+        """Ask the worker loop to stop, it notices within half a second"""
+        self.worker.running = False
+
+    kill = terminate
+
+
+def start_worker_in_api(backend: str, printer_name: str, printer_port: str, conn, status_queue,
+                        preferred_baud: Optional[int] = None, resync_event=None):
+    """Start a printer worker inside the api process with the thread or task backend"""
+    worker = PrinterWorkerProcess(
+        printer_name, printer_port, conn, status_queue,
+        preferred_baud=preferred_baud,
+        resync_event=resync_event,
+        handle_signals=False
+    )
+    handle_class = ThreadWorker if backend == "thread" else TaskWorker
+    handle = handle_class(worker, name=f"PrinterWorker-{printer_name}")
+    handle.start()
+    return handle
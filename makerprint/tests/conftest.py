@@ -0,0 +1,9 @@
+import os
+import tempfile
+
+# the makerprint modules create their managers at import, keep them away from /data
+_data_dir = tempfile.mkdtemp(prefix="makerprint-tests-")
+os.environ.setdefault("GCODEFOLDER", os.path.join(_data_dir, "gcode"))
+os.environ.setdefault("DATABASE_PATH", os.path.join(_data_dir, "makerprint.db"))
+os.environ.setdefault("PRINTER_CONFIG", os.path.join(_data_dir, "printers.yaml"))
+os.environ.setdefault("LOGPATH", os.path.join(_data_dir, "log.txt"))
@@ -0,0 +1,41 @@
+from types import SimpleNamespace
+
+import pytest
+
+from makerprint.file_manager import PrintQueueManager
+
+printcore = pytest.importorskip("printrun.printcore")
+if not hasattr(printcore, "Callback"):
+    pytest.skip("Printrun without printcore.Callback", allow_module_level=True)
+
+from makerprint import printer  # noqa: E402
+
+
+@pytest.fixture
+def queue(tmp_path, monkeypatch):
+    queue = PrintQueueManager(str(tmp_path / "queue.db"))
+    monkeypatch.setattr(printer, "queue_manager", queue)
+    monkeypatch.setattr(printer.utils, "QUEUE_ARCHIVE_DELAY", 0)
+    return queue
+
+
+def test_finished_print_keeps_printer_and_start(queue):
+    item_id = queue.add_to_queue("part.gcode", "part.gcode")
+    queue.mark_print_started(item_id, "P1")
+    started_at = queue.get_queue_item_by_id(item_id).started_at
+
+    # end of print callback of printcore, on a printer that isn't paused
+    fake_printer = SimpleNamespace(
+        paused=False, current_queue_item_id=item_id, start_time=None, name="P1",
+        _reset_print_timing=lambda: None,
+    )
+    printer.Printer._endcb(fake_printer)
+
+    item = queue.get_queue_item_by_id(item_id)
+    assert item.status == "finished"
+    assert item.printer_name == "P1"
+    assert item.started_at == started_at
+
+    assert queue.archive_completed_items() == 1
+    history = queue.get_history(printer_name="P1")
+    assert [(entry.id, entry.started_at) for entry in history] == [(item_id, started_at)]